@@ -788,6 +788,18 @@ class AppGUI(Tk):
         self.status_bar.var_parse_speed.set(self._get_stat(stats.get('parse-speed'), suffix=' item/s'))
         self.status_bar.var_parse_time.set(self._get_stat(stats.get('parse-time'), suffix='s'))
 
+        pages = stats.get('flow-pages')
+        if pages is None:
+            self.status_bar.var_flow.set('N/A')
+        else:
+            self.status_bar.var_flow.set('{} ({:.0f} MB)'.format(pages, stats['flow-bytes'] / 1024 ** 2))
+
+        costliest = stats.get('filter-costliest')
+        if costliest is None:
+            self.status_bar.var_filter_cost.set('N/A')
+        else:
+            self.status_bar.var_filter_cost.set('{} ({:.0%})'.format(costliest, stats['filter-costliest-share']))
+
         self.after(1000, self.update_statistics)
 
     def start_scan(self):
@@ -1752,9 +1764,11 @@ class StatusBar(Frame):
         lbl, val, self.var_peek_time = self.add('Peek time:', value='N/A')
         lbl, val, self.var_req_delay_time = self.add('Delay time:', value='N/A')
         lbl, val, self.var_queue_time = self.add('Queue time:', value='N/A')
+        lbl, val, self.var_flow = self.add('Pending:', value='N/A')
 
         lbl, val, self.var_parse_time = self.add('Parse time:', value='N/A')
         lbl, val, self.var_parse_speed = self.add('Parse speed:', value='N/A')
+        lbl, val, self.var_filter_cost = self.add('Costliest filter:', value='N/A')
 
         self.rowconfigure(0, pad=5)
         self.columnconfigure(0, weight=1)
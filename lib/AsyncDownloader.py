@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import ssl
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from lib.Downloader import BaseDownloader, CONNECT_TIMEOUT, TIMEOUT
+from lib.Utility import msgr, logexception
+
+# bytes read from the connection at a time, same as curl's write size
+READ_SIZE = 16 * 1024
+# decodes both gzip and zlib streams
+DECODE_WBITS = zlib.MAX_WBITS | 32
+
+
+class TransferAborted(Exception):
+    """ Raised when a request stops receiving its body, as skipped requests do once the next ID is known """
+
+
+class AsyncDownloader(BaseDownloader):
+    """
+    Downloader transferring requests with asyncio streams, HTTP/1.1 with keep-alive connections.
+    Runs an event loop of its own when started as a thread, or on a running loop by awaiting serve().
+    Stopping it, or cancelling serve(), cancels the transfers in progress.
+    """
+
+    def __init__(self, start_id, conns=2, skip_timeout=120, stream=False, flow=None):
+        self.loop = None
+        self.wakeup = None
+        self.idle = {}  # idle connections by (scheme, host, port)
+
+        BaseDownloader.__init__(self, start_id, conns, skip_timeout, stream, flow)
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.serve())
+        finally:
+            loop.close()
+
+    async def serve(self):
+        """ Downloads until stopped """
+        self.loop = asyncio.get_event_loop()
+        self.wakeup = asyncio.Event()
+        transfers = set()
+
+        try:
+            self._on_start()
+
+            while not self.evt_stop.is_set():
+                with self.req_queue_lock:
+                    while len(transfers) < self.conns and self._can_send():
+                        req = self._take_request()
+                        self._on_send(req)
+                        transfer = self.loop.create_task(self._transfer(req))
+                        transfer.add_done_callback(transfers.discard)
+                        transfers.add(transfer)
+
+                self._handle_finished()
+
+                # a timer rather than wait_for, which can swallow a cancellation arriving as it times out
+                timer = self.loop.call_later(self._get_timeout(self.conns - len(transfers)), self.wakeup.set)
+                try:
+                    await self.wakeup.wait()
+                finally:
+                    timer.cancel()
+                self.wakeup.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            msgr.send_msg("Unexpected error occurred while downloading: {}. Error details logged to file.".format(e),
+                          logging.ERROR)
+            logexception()
+        finally:
+            for transfer in transfers:
+                transfer.cancel()
+            if transfers:
+                await asyncio.gather(*transfers, return_exceptions=True)
+
+            self._close()
+            self._on_stop()
+
+    def stop(self):
+        BaseDownloader.stop(self)
+        self._wake()
+
+    def _wake(self):
+        if self.loop is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # loop is closed
+            pass
+
+    def _submit(self, req):
+        BaseDownloader._submit(self, req)
+        self._wake()
+
+    async def _transfer(self, req):
+        try:
+            code = await asyncio.wait_for(self._fetch(req), TIMEOUT)
+        except TransferAborted as e:
+            self._on_error(req, 'aborted', e, time.time() - req.start_time)
+        except asyncio.TimeoutError:
+            self._on_error(req, 'timeout', 'Operation timed out after {} seconds'.format(TIMEOUT),
+                           time.time() - req.start_time)
+        except (OSError, EOFError, ValueError, zlib.error) as e:
+            self._on_error(req, getattr(e, 'errno', None) or type(e).__name__, e, time.time() - req.start_time)
+        except Exception as e:
+            # the request is retried, otherwise requests after it are never handed over
+            logexception()
+            self._on_error(req, type(e).__name__, e, time.time() - req.start_time)
+        else:
+            self._on_response(req, code, time.time() - req.start_time)
+        finally:
+            self.wakeup.set()
+
+    async def _fetch(self, req):
+        """ :return: HTTP status code of the response, once its body is received """
+        url = urlsplit(self.url.format(req.req_id))
+        key = (url.scheme, url.hostname, url.port or (443 if url.scheme == 'https' else 80))
+        path = url.path + ('?' + url.query if url.query else '')
+
+        message = ('GET {} HTTP/1.1\r\n'
+                   'Host: {}\r\n'
+                   'Accept: */*\r\n'
+                   'Accept-Encoding: gzip, deflate\r\n'
+                   '\r\n').format(path, url.netloc).encode('ascii')
+
+        reader, writer, reused = await self._connect(key)
+        try:
+            writer.write(message)
+            status_line = await reader.readline()
+            if not status_line and reused:
+                # idle connection was closed by the server
+                writer.close()
+                reader, writer, reused = await self._connect(key, reuse=False)
+                writer.write(message)
+                status_line = await reader.readline()
+
+            code, keep_alive = await self._receive(req, reader, status_line)
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self.idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+
+        return code
+
+    async def _connect(self, key, reuse=True):
+        """ :return: reader, writer, whether the connection was idle """
+        idle = self.idle.get(key)
+        while reuse and idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        ctx = ssl.create_default_context() if scheme == 'https' else None
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ctx), CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    async def _receive(self, req, reader, status_line):
+        """
+        Receives a response, passing its headers and decoded body to the request
+        :return: HTTP status code, whether the connection can be reused
+        """
+        fields = status_line.split(None, 2)
+        if len(fields) < 2 or not fields[0].startswith(b'HTTP/') or not fields[1].isdigit():
+            raise ValueError('Bad status line: {!r}'.format(status_line[:100]))
+
+        req.header(status_line)
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise EOFError('Connection closed while receiving headers')
+            if line in (b'\r\n', b'\n'):
+                break
+            req.header(line)
+
+        headers = req.headers
+        encoding = headers.get('content-encoding', '').lower()
+        decoder = zlib.decompressobj(DECODE_WBITS) if encoding in ('gzip', 'deflate') else None
+
+        def write(data):
+            if decoder:
+                data = decoder.decompress(data)
+            if data and req.write(self, data) == -1:
+                raise TransferAborted('Failed writing body')
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    break
+                while size:
+                    data = await reader.read(min(size, READ_SIZE))
+                    if not data:
+                        raise EOFError('Connection closed while receiving body')
+                    size -= len(data)
+                    write(data)
+                await reader.readexactly(2)
+
+            # trailers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            complete = True
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                data = await reader.read(min(remaining, READ_SIZE))
+                if not data:
+                    raise EOFError('Connection closed while receiving body')
+                remaining -= len(data)
+                write(data)
+            complete = True
+        else:
+            # body ends with the connection
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                write(data)
+            complete = False
+
+        if decoder:
+            data = decoder.flush()
+            if data:
+                req.write(self, data)
+
+        keep_alive = complete and fields[0] == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return int(fields[1]), keep_alive
+
+    def _close(self):
+        for conns in self.idle.values():
+            for reader, writer in conns:
+                writer.close()
+        self.idle = {}
@@ -0,0 +1,122 @@
+"""
+Download buffer benchmark, no requests are sent.
+Usage: python -m lib.BufferBenchmark [<pages>]
+Pages of 3-8 MB are written in curl sized chunks, some are reset halfway as on a retry,
+then handed to the parser and released. Reports the best time of a few rounds,
+and the memory allocated while handling a page, as traced by tracemalloc.
+"""
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from lib.DownloadBuffer import DownloadBufferPool
+
+CHUNK_SIZE = 16 * 1024
+RETRY_RATE = 0.1
+
+
+class BytesIOPages:
+    """ A new BytesIO for every request and retry, copied for the parser, as the downloader used to """
+
+    def __init__(self):
+        self.buffer = None
+
+    def start(self):
+        self.buffer = BytesIO()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def reset(self):
+        self.buffer = BytesIO()
+
+    def handoff(self):
+        return self.buffer.getvalue()
+
+    def release(self):
+        self.buffer = None
+
+
+class PooledPages:
+    """ Pooled buffers, viewed by the parser """
+
+    def __init__(self):
+        self.pool = DownloadBufferPool()
+        self.buffer = None
+
+    def start(self):
+        self.buffer = self.pool.acquire()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def reset(self):
+        self.buffer.clear()
+
+    def handoff(self):
+        return self.buffer.getbuffer()
+
+    def release(self):
+        self.pool.release(self.buffer)
+        self.buffer = None
+
+
+def download(pages, size, retry, chunk):
+    """ :return: sum of the bytes the parser was handed, so the handoff is not optimized away """
+    pages.start()
+    if retry:
+        for pos in range(0, size // 2, CHUNK_SIZE):
+            pages.write(chunk)
+        pages.reset()
+    for pos in range(0, size, CHUNK_SIZE):
+        pages.write(chunk)
+
+    data = pages.handoff()
+    n = len(data)
+    del data
+    pages.release()
+    return n
+
+
+def benchmark(methods, n, rounds=3):
+    rnd = random.Random(0)
+    sizes = [rnd.randint(3 * 1024 ** 2, 8 * 1024 ** 2) for _ in range(n)]
+    retries = [rnd.random() < RETRY_RATE for _ in range(n)]
+    chunk = b'x' * CHUNK_SIZE
+
+    for name, pages_cls in methods:
+        pages = pages_cls()
+        # first page warms up the pool
+        download(pages, sizes[0], False, chunk)
+
+        # timed without tracing, tracemalloc slows down allocations
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for size, retry in zip(sizes, retries):
+                download(pages, size, retry, chunk)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        peak_sum = 0
+        for size, retry in zip(sizes, retries):
+            tracemalloc.reset_peak()
+            download(pages, size, retry, chunk)
+            current, peak = tracemalloc.get_traced_memory()
+            peak_sum += peak - base
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print('{:<10} {:>9.1f}ms {:>10.2f} MB allocated per page {:>10.2f} MB retained'.format(
+            name, best * 1000, peak_sum / n / 1024 ** 2, (current - base) / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print('Pages: {}, retry rate: {:.0%}'.format(page_count, RETRY_RATE))
+    benchmark([('bytesio', BytesIOPages), ('pooled', PooledPages)], page_count)
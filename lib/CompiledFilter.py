@@ -59,24 +59,153 @@ _FILTER_PRIO = {
     'fgs': 5
 }
 
+# rejection condition of every criterion, as used by generated predicates.
+# criteria of the same priority are checked in this order
+_CRIT_CHECKS = {
+    'rarity': 'item.rarity not in self.rarity',
+    'price_min': 'item.c_price is not None and item.c_price < self.price_min',
+    'price_max': 'item.c_price is not None and item.c_price > self.price_max',
+    'buyout': 'self.buyout != item.buyout',
+    'name': 'not self._matchNames(item)',
+    'links_min': 'self.links_min > item.links_count',
+    'links_max': 'self.links_max < item.links_count',
+    'base': 'self.base not in item.c_base',
+    'ilvl_min': 'self.ilvl_min > item.ilvl',
+    'ilvl_max': 'self.ilvl_max < item.ilvl',
+    'corrupted': 'self.corrupted != item.corrupted',
+    'modifiable': 'self.modifiable != item.modifiable',
+    'identified': 'self.identified != item.identified',
+    'crafted': 'self.crafted != item.crafted',
+    'enchanted': 'self.enchanted != item.enchanted',
+    'sockets_min': 'self.sockets_min > item.sockets_count',
+    'sockets_max': 'self.sockets_max < item.sockets_count',
+    'stacksize_min': 'self.stacksize_min > item.stacksize',
+    'stacksize_max': 'self.stacksize_max < item.stacksize',
+    'modcount_min': 'self.modcount_min > item.modcount',
+    'modcount_max': 'self.modcount_max < item.modcount',
+    'iclass': 'self.iclass & item.iclass != item.iclass',
+    'level_min': 'self.level_min > max(item.level, item.tier)',
+    'level_max': 'self.level_max < max(item.level, item.tier)',
+    'exp': 'self.exp > item.exp',
+    'quality_min': 'self.quality_min > item.quality',
+    'quality_max': 'self.quality_max < item.quality',
+    'es_min': 'self.es_min > item.es',
+    'es_max': 'self.es_max < item.es',
+    'armour_min': 'self.armour_min > item.armour',
+    'armour_max': 'self.armour_max < item.armour',
+    'evasion_min': 'self.evasion_min > item.evasion',
+    'evasion_max': 'self.evasion_max < item.evasion',
+    'dps_min': 'self.dps_min > item.dps',
+    'dps_max': 'self.dps_max < item.dps',
+    'edps_min': 'self.edps_min > item.edps',
+    'edps_max': 'self.edps_max < item.edps',
+    'pdps_min': 'self.pdps_min > item.pdps',
+    'pdps_max': 'self.pdps_max < item.pdps',
+    'aps_min': 'self.aps_min > item.aps',
+    'aps_max': 'self.aps_max < item.aps',
+    'crit_min': 'self.crit_min > item.crit',
+    'crit_max': 'self.crit_max < item.crit',
+    'block_min': 'self.block_min > item.block',
+    'block_max': 'self.block_max < item.block',
+}
+
+_CRIT_ORDER = {key: (_FILTER_PRIO[key], i) for i, key in enumerate(_CRIT_CHECKS)}
+_CRIT_ORDER['fgs'] = (_FILTER_PRIO['fgs'], len(_CRIT_ORDER))
+
+# stage reported by staged predicates when a criterion rejects an item, bounds of a field share a stage
+_CRIT_STAGES = {key: key[:-4] if key.endswith(('_min', '_max')) else key for key in _CRIT_CHECKS}
+_CRIT_STAGES['fgs'] = 'mods'
+
+# predicates by filter shape, most filters share the same few shapes
+_PREDICATES = {}
+
+
+def _get_predicate(keys, fg_count, staged=False):
+    """
+    :param staged: if set, the predicate returns the stage rejecting an item instead of False, None instead of True
+    """
+    shape = (keys, fg_count, staged)
+    predicate = _PREDICATES.get(shape)
+    if predicate is None:
+        lines = ['def predicate(self, item):']
+        conditions = [(_CRIT_CHECKS[key], _CRIT_STAGES[key]) for key in keys]
+        conditions.extend(('not self.fgs[{}].checkMods(item)'.format(i), _CRIT_STAGES['fgs']) for i in range(fg_count))
+        for cond, stage in conditions:
+            lines.append('    if {}:'.format(cond))
+            lines.append('        return {}'.format(repr(stage) if staged else 'False'))
+        lines.append('    return {}'.format('None' if staged else 'True'))
+
+        namespace = {}
+        exec('\n'.join(lines), namespace)
+        predicate = _PREDICATES[shape] = namespace['predicate']
+
+    return predicate
+
 
 class CompiledFilter:
     # __slots__ = _FILTER_PRIO.keys() | {'fltr', 'comp', 'enabled', 'crit_ordered'}
-    __slots__ = ('rarity', 'armour_max', 'crafted', 'sockets_min', 'pdps_min', 'buyout', 'links_max', 'corrupted', 'block_min', 'stacksize_min', 'quality_max', 'crit_min', 'ilvl_min', 'es_max', 'base', 'aps_min', 'ilvl_max', 'crit_ordered', 'links_min', 'modifiable', 'armour_min', 'level_max', 'price_min', 'aps_max', 'modcount_min', 'edps_max', 'iclass', 'evasion_max', 'stacksize_max', 'enabled', 'identified', 'fltr', 'crit_max', 'sockets_max', 'quality_min', 'modcount_max', 'block_max', 'level_min', 'es_min', 'price_max', 'comp', 'dps_max', 'dps_min', 'enchanted', 'exp', 'pdps_max', 'name', 'fgs', 'evasion_min', 'edps_min')
+    __slots__ = ('predicate', 'rarity', 'armour_max', 'crafted', 'sockets_min', 'pdps_min', 'buyout', 'links_max', 'corrupted', 'block_min', 'stacksize_min', 'quality_max', 'crit_min', 'ilvl_min', 'es_max', 'base', 'aps_min', 'ilvl_max', 'crit_ordered', 'links_min', 'modifiable', 'armour_min', 'level_max', 'price_min', 'aps_max', 'modcount_min', 'edps_max', 'iclass', 'evasion_max', 'stacksize_max', 'enabled', 'identified', 'fltr', 'crit_max', 'sockets_max', 'quality_min', 'modcount_max', 'block_max', 'level_min', 'es_min', 'price_max', 'comp', 'dps_max', 'dps_min', 'enchanted', 'exp', 'pdps_max', 'name', 'fgs', 'evasion_min', 'edps_min',
+                 'name_exact', 'name_parts')
 
     def __init__(self, fltr, comp):
         self.fltr = fltr
         self.comp = comp
         self.enabled = fltr.enabled
         self.crit_ordered = sorted(comp.keys(), key=lambda k: _FILTER_PRIO[k])
+        self.predicate = None
 
     def __str__(self):
         return self.getDisplayTitle()
 
-    def finalize(self):
+    def __getstate__(self):
+        # generated predicates cannot be pickled, they are generated again instead
+        state = {att: getattr(self, att) for att in self.__slots__ if att != 'predicate' and hasattr(self, att)}
+        return state, self.predicate is not None
+
+    def __setstate__(self, state):
+        state, finalized = state
+        for att, val in state.items():
+            setattr(self, att, val)
+
+        self.predicate = None
+        if finalized:
+            self._generatePredicate()
+
+    def finalize(self, crit_stats=None):
+        """
+        :param crit_stats: CriteriaStats to order the checks by, static order if None
+        """
         for att in _FILTER_PRIO:
             setattr(self, att, self.comp.get(att, None))
 
+        keys = [key for key in self.comp if key != 'fgs' and getattr(self, key) is not None]
+        if crit_stats is None:
+            self.crit_ordered = tuple(sorted(keys, key=_CRIT_ORDER.__getitem__))
+        else:
+            self.crit_ordered = crit_stats.getOrder(keys, self)
+
+        self.name_exact = self.name_parts = None
+        if self.name is not None:
+            names = [name for name in self.name if name]
+            self.name_exact = frozenset(name[1:-1] for name in names if name[0] == name[-1] == '"')
+            self.name_parts = frozenset(name for name in names if not name[0] == name[-1] == '"')
+
+        self._generatePredicate()
+
+    def _generatePredicate(self):
+        """
+        Generates a predicate checking only the criteria this filter has, in the order finalize set.
+        Predicates are shared by filters with the same criteria and take the filter as their first argument.
+        """
+        self.predicate = _get_predicate(*self._getShape())
+
+    def _getShape(self):
+        return self.crit_ordered, len(self.fgs) if self.fgs is not None else 0
+
+    def getStagedPredicate(self):
+        """ :return: variant of the predicate returning the stage rejecting an item, None if the item matches """
+        return _get_predicate(*self._getShape(), staged=True)
+
     def getDisplayPrice(self):
         if 'price_max' not in self.comp:  # or self.comp['price'] <= 0:
             return ''
@@ -107,7 +236,18 @@ class CompiledFilter:
 
         return False
 
+    def _matchNames(self, item):
+        """ _checkNames using the name fragments found in the item name by the filter index, if it did """
+        name_matches = item.name_matches
+        if name_matches is None:
+            return self._checkNames(item.c_name, self.name)
+        return item.c_name in self.name_exact or not self.name_parts.isdisjoint(name_matches)
+
     def checkItem(self, item):
+        return self.predicate(self, item)
+
+    def checkItemAll(self, item):
+        """ Checks every criterion attribute, reference implementation of the generated predicate """
         if self.rarity is not None and item.rarity not in self.rarity:
             return False
         if self.price_min is not None and item.c_price is not None and item.c_price < self.price_min:
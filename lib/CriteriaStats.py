@@ -0,0 +1,138 @@
+import random
+import threading
+
+from lib.CompiledFilter import _CRIT_CHECKS, _CRIT_ORDER, _FILTER_PRIO
+
+# fields parsed from item properties, criteria reading them are too costly to evaluate when no filter needs them
+_COSTLY_FIELDS = {'quality', 'level', 'exp', 'es', 'armour', 'evasion', 'dps', 'edps', 'pdps', 'aps', 'crit', 'block'}
+
+# rejection condition of every criterion on its own, as used by the sampler. Costly criteria are not sampled
+_CRIT_REJECTS = {key: eval('lambda self, item: {}'.format(cond)) for key, cond in _CRIT_CHECKS.items()
+                 if key.rsplit('_', 1)[0] not in _COSTLY_FIELDS}
+
+# sampler of the worker process
+_sampler = None
+
+
+class CriteriaStats:
+    """
+    Rejection rates of filter criteria, sampled by the workers on the live stream.
+    Compiled filters order their checks by expected cost per rejection when they are finalized,
+    cost being the criterion priority. Mod filter groups are always checked last.
+    Rates are kept for every criterion of every filter, as they depend on its values.
+    Until a filter criterion has enough samples the rate of the criterion over all filters is used,
+    until that has enough samples it is assumed to reject half of the items, which keeps the static order.
+    Sampling is opt-in, see config.criteria_sampling.
+    """
+
+    MIN_SAMPLES = 200
+    # counts are halved past this many samples, so rates follow the stream
+    MAX_SAMPLES = 100000
+
+    def __init__(self):
+        self.samples = {}  # criterion to [evaluations, rejections]
+        self.filter_samples = {}  # (filter key, criterion) to [evaluations, rejections]
+        self.lock = threading.Lock()
+
+    def add(self, filters, samples):
+        """
+        :param filters: filters of the snapshot the samples were taken with
+        :param samples: samples collected by a worker sampler
+        """
+        with self.lock:
+            for (pos, key), (evals, rejects) in samples.items():
+                self._add(self.samples, key, evals, rejects)
+                self._add(self.filter_samples, (_filter_key(filters[pos]), key), evals, rejects)
+
+    def _add(self, samples, key, evals, rejects):
+        entry = samples.get(key)
+        if entry is None:
+            entry = samples[key] = [0, 0]
+        entry[0] += evals
+        entry[1] += rejects
+        if entry[0] > self.MAX_SAMPLES:
+            entry[0] //= 2
+            entry[1] //= 2
+
+    def getRate(self, key, fltr=None):
+        """ :param fltr: compiled filter to get the rate of its criterion, the rate over all filters if None """
+        evals, rejects = 0, 0
+        if fltr is not None:
+            evals, rejects = self.filter_samples.get((_filter_key(fltr), key), (0, 0))
+        if evals < self.MIN_SAMPLES:
+            evals, rejects = self.samples.get(key, (0, 0))
+        if evals < self.MIN_SAMPLES:
+            return 0.5
+        # never zero, a criterion that rejects nothing still goes after the others
+        return (rejects + 1) / (evals + 2)
+
+    def getOrder(self, keys, fltr=None):
+        """ :return: tuple of criteria keys (excluding fgs) of the filter in the order they should be checked """
+        with self.lock:
+            return tuple(sorted(keys, key=lambda key: (_FILTER_PRIO[key] / self.getRate(key, fltr), _CRIT_ORDER[key])))
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+            self.filter_samples.clear()
+
+
+class CriteriaSampler:
+    """
+    Checks every criterion of a few filters on its own, for one of every interval items of a worker.
+    Criteria reading fields parsed from item properties are skipped, they keep their static order.
+    """
+
+    # filters checked per sampled item, at most
+    SAMPLE_FILTERS = 16
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.count = 0
+        self.samples = {}  # (filter position, criterion) to [evaluations, rejections]
+
+    def sample(self, index, items):
+        start = -self.count % self.interval
+        self.count += len(items)
+
+        samples = self.samples
+        for item in items[start::self.interval]:
+            candidates = index.getCandidates(item)
+            if len(candidates) > self.SAMPLE_FILTERS:
+                candidates = random.sample(candidates, self.SAMPLE_FILTERS)
+
+            for pos, fltr in candidates:
+                for key in fltr.crit_ordered:
+                    reject = _CRIT_REJECTS.get(key)
+                    if reject is None:
+                        continue
+
+                    entry = samples.get((pos, key))
+                    if entry is None:
+                        entry = samples[(pos, key)] = [0, 0]
+                    entry[0] += 1
+                    if reject(fltr, item):
+                        entry[1] += 1
+
+    def collect(self):
+        """ :return: samples taken since the last call """
+        samples = dict(self.samples)
+        self.samples.clear()
+        return samples
+
+
+def _filter_key(fltr):
+    """ :return: key of a compiled filter which is kept when filters are compiled again """
+    return fltr.fltr.id or fltr.fltr.title
+
+
+def get_sampler(interval):
+    """ :return: criteria sampler of the worker process, sampling one of every interval items """
+    global _sampler
+
+    if _sampler is None or _sampler.interval != interval:
+        _sampler = CriteriaSampler(interval)
+    return _sampler
+
+
+crit_stats = CriteriaStats()
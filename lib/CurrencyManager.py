@@ -39,6 +39,7 @@ class CurrencyManager:
 
         self.cshorts = {}  # short to full name mapping
         self.crates = {}  # rates with overrides
+        self.version = 0  # incremented on every compile
         self.compile_lock = threading.Lock()
         self.confidence_level = self.DEFAULT_CONFIDENCE_LEVEL
 
@@ -111,6 +112,7 @@ class CurrencyManager:
             self.overrides = overrides
             self.cshorts = tcm.cshorts
             self.crates = tcm.crates
+            self.version += 1
 
             if last_update:
                 self.last_update = last_update
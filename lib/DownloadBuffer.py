@@ -0,0 +1,101 @@
+from threading import Lock
+
+# page size estimate until pages are downloaded, buffers get some headroom above it
+PAGE_SIZE = 4 * 1024 * 1024
+PAGE_HEADROOM = 1.25
+BUFFER_ALIGN = 1024 * 1024
+MAX_FREE_BUFFERS = 8
+# weight of a new page size in the typical page size
+SIZE_SMOOTHING = 0.1
+
+
+class DownloadBuffer:
+    """
+    Preallocated buffer for a downloaded page.
+    Writes fill the buffer in place, it only reallocates when a page outgrows it.
+    """
+
+    def __init__(self, capacity=0):
+        self.data = bytearray(capacity)
+        # writes go through a view, slice assignment to a view is cheaper than to the bytearray itself
+        self.view = memoryview(self.data)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    def write(self, data):
+        end = self.size + len(data)
+        if end > len(self.data):
+            self._grow(end)
+
+        self.view[self.size:end] = data
+        self.size = end
+
+    def _grow(self, size):
+        # a new buffer rather than resizing, views of the contents may still be around
+        data = bytearray(max(size, len(self.data) * 2))
+        view = memoryview(data)
+        view[:self.size] = self.view[:self.size]
+        self.data, self.view = data, view
+
+    def getbuffer(self):
+        """ :return: view of the contents, valid until the buffer is cleared or released """
+        return self.view[:self.size]
+
+    def getvalue(self):
+        with self.getbuffer() as view:
+            return view.tobytes()
+
+    def clear(self):
+        self.size = 0
+
+
+class DownloadBufferPool:
+    """ Recycles download buffers, new ones are sized for the typical page """
+
+    def __init__(self):
+        self.free = []
+        self.page_size = PAGE_SIZE
+        self.lock = Lock()
+
+        self.allocated = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                # largest first, it is the least likely to grow
+                return self.free.pop()
+
+            self.allocated += 1
+            size = int(self.page_size * PAGE_HEADROOM)
+            return DownloadBuffer(-(-size // BUFFER_ALIGN) * BUFFER_ALIGN)
+
+    def release(self, buf, page=True):
+        """
+        Returns a buffer to the pool
+        :param page: whether the buffer holds a whole page, its size is used to size new buffers
+        """
+        with self.lock:
+            if page and len(buf):
+                self.page_size += (len(buf) - self.page_size) * SIZE_SMOOTHING
+            buf.clear()
+
+            self.free.append(buf)
+            self.free.sort(key=lambda b: b.capacity)
+            if len(self.free) > MAX_FREE_BUFFERS:
+                self.free.pop(0)
+
+    def get_stats(self):
+        stats = {}
+
+        with self.lock:
+            stats['dl-buffers-allocated'] = self.allocated
+            stats['dl-buffers-free'] = len(self.free)
+            stats['dl-page-size'] = self.page_size
+
+        return stats
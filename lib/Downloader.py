@@ -1,25 +1,31 @@
 import functools
+import heapq
+import itertools
 import json
 import pycurl
-import re
 import traceback
 from collections import deque
-from io import BytesIO
-from queue import Queue, Empty, Full
-from threading import Thread, Lock, Event
+from threading import Thread, Lock, Event, Condition
 
 import time
 
 import logging
 
+from lib.DownloadBuffer import DownloadBuffer, DownloadBufferPool
+from lib.FlowControl import FlowControl
+from lib.RequestPacer import RequestPacer
+from lib.StashHelper import StashSplitter, peek_next_id
 from lib.Utility import msgr, logexception, config
 
 TIMEOUT = 30
 CONNECT_TIMEOUT = 5
-# REQ_DELAY = 0.7
+# used when the configuration is not loaded, as when the downloader runs on its own
+REQ_DELAY = 0.7
+MEMORY_BUDGET = 256  # MB
 SUFFICIENT_DELTA = 100
 URL = "http://api.pathofexile.com/public-stash-tabs?id={}"
-RES_QUEUE_MAXSIZE = 50
+# wake up interval while downloads are paused for memory
+FLOW_POLL_INTERVAL = 0.1
 # START_ID = '65986412-69582870-65115932-75710468-70380757'
 # START_ID = '94987699-99693565-93693051-108145998-100918828'
 START_ID = '95172882-99885924-93870471-108349815-101111064'
@@ -68,9 +74,18 @@ def get_delta(prev_id, curr_id):
     return sum(map(lambda x, y: int(y) - int(x), l1, l2))
 
 class Request:
-    def __init__(self, req_id, skip_data=False):
+    def __init__(self, req_id, skip_data=False, stream=False, flow=None, buffers=None):
         self.req_id = req_id
-        self.buffer = BytesIO()
+        self.seq = None  # order among the requests of the downloader, assigned when added
+        # buffer is taken when the request is sent, from the pool when there is one,
+        # and goes back to it once the request is released
+        self.buffers = buffers
+        self.buffer = None
+        self.size = 0  # bytes downloaded
+        self.flow = flow
+        self.charged = 0  # buffer capacity accounted for by flow control
+        self.released = False
+        self.headers = {}  # response headers by lowercase name
         self.submitted_next = None
         self.added_time = None
         self.submit_time = None
@@ -78,14 +93,108 @@ class Request:
         self.peek_time = None
 
         self.finished = False
+        self.cancelled = False
+        self.dispatched = False
         self.skip_data = skip_data
 
+        # streamed requests are handed to the consumer before they finish, stashes are consumed as they arrive
+        self.stream = stream and not skip_data
+        self.splitter = StashSplitter() if self.stream else None
+        # bumped on every reset, the body of a retry may differ from the one stashes were taken from
+        self.generation = 0
+        self.cond = Condition()
+
+    def acquire(self):
+        """ Takes a buffer for the download, retries keep theirs """
+        with self.cond:
+            if self.buffer is None and not self.released:
+                self.buffer = self.buffers.acquire() if self.buffers else DownloadBuffer()
+                self._charge()
+
+    def _charge(self):
+        """ Accounts for the capacity of the buffer in flow control, buffers only grow while they are held """
+        capacity = self.buffer.capacity
+        if self.flow and capacity > self.charged:
+            self.flow.add(capacity - self.charged)
+        self.charged = capacity
+
     def reset(self):
-        self.buffer = BytesIO()
+        with self.cond:
+            # the buffer is kept for the retry, as is its capacity in flow control
+            if self.buffer is not None:
+                self.buffer.clear()
+            self.headers = {}
+            self.size = 0
+            if self.stream:
+                # a redownload can yield other stashes, the newest page grows between attempts
+                self.splitter = StashSplitter()
+                self.generation += 1
+                self.cond.notify_all()
+
+    def release(self):
+        """ Returns the buffer to the pool and its capacity to flow control, once the request data is no longer used """
+        with self.cond:
+            if self.released:
+                return
+            self.released = True
+
+            if self.flow:
+                self.flow.release(self.charged)
+            self.charged = 0
+            if self.buffers and self.buffer is not None:
+                self.buffers.release(self.buffer, page=self.finished and not self.skip_data)
+            self.buffer = None
+
+    def finish(self):
+        with self.cond:
+            self.finished = True
+            self.cond.notify_all()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify_all()
+
+    def get_stashes(self, start, generation, timeout=None):
+        """
+        Waits for stashes beyond the first start stashes of a streamed request.
+        Stashes taken from an earlier generation are not counted, they start over from the first stash of the retry
+        :return: list of raw stash objects, generation they were taken from, whether no more stashes will follow
+        """
+        with self.cond:
+            if generation != self.generation:
+                start = 0
+            if len(self.splitter.ranges) <= start and not (self.finished or self.cancelled):
+                self.cond.wait(timeout)
+                if generation != self.generation:
+                    start = 0
+
+            if self.buffer is None:
+                # not sent yet
+                chunks = []
+            else:
+                with self.buffer.getbuffer() as view:
+                    chunks = [view[begin:end].tobytes() for begin, end in self.splitter.ranges[start:]]
+
+            return chunks, self.generation, self.finished or self.cancelled
 
     def write(self, dl, data):
-        self.buffer.write(data)
-        if not self.submitted_next and len(self.buffer.getbuffer()) > 512:
+        self.size += len(data)
+
+        if self.stream:
+            with self.cond:
+                self.buffer.write(data)
+                with self.buffer.getbuffer() as view:
+                    if self.splitter.feed(view):
+                        self.cond.notify_all()
+        else:
+            self.buffer.write(data)
+
+        if self.buffer.capacity != self.charged:
+            # the buffer grew
+            self._charge()
+
+        if not self.submitted_next and len(self.buffer) > 512:
             next_id = self._peek_id(self.buffer.getbuffer()[:512])
             if next_id:
                 dl.add_request(next_id)
@@ -98,27 +207,50 @@ class Request:
             # else:
             #     msgr.send_msg("Peek failed, contents: ".format(self.buffer.getvalue().decode()), logging.WARN)
 
+    def header(self, line):
+        line = line.decode('iso-8859-1')
+        if line.startswith('HTTP/'):
+            # headers of a new response
+            self.headers = {}
+        elif ':' in line:
+            name, value = line.split(':', 1)
+            self.headers[name.strip().lower()] = value.strip()
+
     def _peek_id(self, data):
-        m = re.search(b'"next_change_id":\s*"([0-9\-]+)"', data)
-        if m:
-            return m.group(1).decode()
-        return None
+        return peek_next_id(data)
 
     def peek_id(self):
-        return self._peek_id(self.buffer.getvalue())
+        with self.buffer.getbuffer() as view:
+            return self._peek_id(view)
+
+class BaseDownloader(Thread):
+    """
+    Downloads pages of the stash API in order, each page chaining to the next by its next_change_id.
+    Handles scheduling, retries, ID deltas and statistics, subclasses transfer requests over their own backend.
+    Downloaded requests are taken with get(), statistics with get_stats().
+    """
 
-class Downloader(Thread):
-    def __init__(self, start_id, conns=2, skip_timeout=120):
+    def __init__(self, start_id, conns=2, skip_timeout=120, stream=False, flow=None):
         Thread.__init__(self)
-        self.m = pycurl.CurlMulti()
+        self.url = URL
+        self.conns = conns
+        self.stream = stream
+        # downloaded requests are handed over through flow control, which pauses downloads when memory runs out
+        if flow is None:
+            budget = config.memory_budget if config.memory_budget is not None else MEMORY_BUDGET
+            flow = FlowControl(budget * 1024 ** 2)
+        self.flow = flow
+        self.buffers = DownloadBufferPool()
 
-        self.handles = [self._create_handle() for i in range(conns)]
-        self.free_handles = list(self.handles)
         self.last_request = None
+        self.start_time = None
+        self.running = False
 
         self.skip_ahead = False
         self.skip_timeout = skip_timeout
         self.dl_deltas = deque(maxlen=10)
+        self.pacer = RequestPacer(config.request_delay if config.request_delay is not None else REQ_DELAY,
+                                  config.smooth_delay is not False)
 
         self.req_time = deque(maxlen=20)
         self.queue_time = deque(maxlen=20)
@@ -131,28 +263,253 @@ class Downloader(Thread):
         self.delta_count = 0
 
         # queue for requests so we can ensure a delay between each request
-        # use a list instead of an actual queue to be able to choose min ID
+        # heap of (seq, request) instead of an actual queue to be able to choose min ID
         self.req_queue = []
         self.req_queue_lock = Lock()
 
         # requests by order
-        self.requests = []
+        self.requests = deque()
         self.requests_lock = Lock()
+        self.req_seq = itertools.count()
 
-        self.res_queue = Queue(maxsize=RES_QUEUE_MAXSIZE)
         self.evt_stop = Event()
 
         self.add_request(start_id)
 
     def calc_stat(self):
         while not self.evt_stop.wait(1):
-            if not self.is_alive():
+            if not self.running:
                 break
 
             with self.delta_lock:
                 self.dps.append(self.delta_count)
                 self.delta_count = 0
 
+    def _on_start(self):
+        msgr.send_msg('Downloader started', logging.INFO)
+        if self.skip_ahead:
+            msgr.send_msg('Skipping ahead.. please wait..')
+        # self.skip_ahead = False
+
+        self.running = True
+        self.stat_thread.start()
+        self.start_time = time.time()
+
+    def _can_send(self):
+        """ :return: whether the next queued request can be sent now, given a free connection. Requires req_queue_lock """
+        return self.req_queue and not self.pacer.get_wait(self.last_request) and \
+            (self.flow.has_room() or self._head_retry_queued())
+
+    def _head_retry_queued(self):
+        """
+        :return: whether the oldest request is queued for a retry. Requires req_queue_lock
+        It is sent regardless of the memory budget, requests after it are not handed over and released until it finishes
+        """
+        return self.requests and self.req_queue[0][1] is self.requests[0] and self.requests[0].start_time is not None
+
+    def _on_send(self, req):
+        """ Records a request which is being sent """
+        req.acquire()
+
+        if self.last_request:
+            delta = time.time() - self.last_request
+        else:
+            delta = 0
+
+        add_delay = time.time() - req.submit_time
+        self.queue_time.append(add_delay)
+
+        self.last_request = time.time()
+        req.start_time = self.last_request
+
+        self.req_delay_time.append(delta)
+
+        # msgr.send_msg('Added: {}, delta: {:.3f}s, add delay: {:.3f}s'.format(req.req_id, delta, add_delay), logging.DEBUG)
+
+    def _on_response(self, req, code, total_time):
+        """ Handles a completed transfer, requests which did not finish are submitted again """
+        wait = self.pacer.on_response(code, req.headers)
+        if wait:
+            msgr.send_msg('Request for ID {} was refused with code {}, holding off requests for {}s'
+                          .format(req.req_id, code, wait), logging.WARN)
+
+        if code == 200:
+            if not req.submitted_next:
+                next_id = req.peek_id()
+                if next_id:
+                    msgr.send_msg('Full peek was required for ID: {}'.format(req.req_id), logging.INFO)
+                    self.add_request(next_id)
+                    req.submitted_next = next_id
+                    req.peek_time = time.time() - req.start_time
+
+            if req.submitted_next:
+                req.finish()
+            else:
+                msgr.send_msg('Request successful for ID {}, but next ID was not found. Redownloading..'
+                              .format(req.req_id), logging.INFO)
+        else:
+            try:
+                err_data = json.loads(req.buffer.getvalue().decode())['error']
+                msgr.send_msg('Request for ID {} failed. {} - Code: {}, Message: {}'
+                              .format(req.req_id, code, err_data['code'], err_data['message']), logging.WARN)
+            except Exception:
+                msgr.send_msg('Request for ID {} failed. {} - {}'.format(req.req_id, code, req.buffer.getvalue().decode()), logging.WARN)
+
+        if not req.finished:
+            req.reset()
+            self._submit(req)
+        else:
+            self.req_time.append(total_time)
+            self.peek_time.append(req.peek_time)
+
+    def _on_error(self, req, errno, errmsg, total_time):
+        """ Handles a failed transfer, requests which did not finish are submitted again """
+        if not req.finished:
+            msgr.send_msg("Failed: {} - Code: {}, {}. Redownloading.."
+                          .format(req.req_id, errno, errmsg), logging.INFO)
+            req.reset()
+            self._submit(req)
+        else:
+            self.req_time.append(total_time)
+            self.peek_time.append(req.peek_time)
+
+    def _handle_finished(self):
+        """ Hands over finished requests in order, updates ID deltas and checks whether skipping ahead is done """
+        with self.requests_lock:
+            deltas_updated = False
+            while self.requests and self.requests[0].finished:
+                req = self.requests.popleft()
+
+                delta = get_delta(req.req_id, req.submitted_next)
+                self.dl_deltas.append(delta)
+                deltas_updated = True
+                with self.delta_lock:
+                    self.delta_count += delta
+
+                if req.skip_data:
+                    req.release()
+                elif not req.dispatched:
+                    self._dispatch(req)
+
+            if deltas_updated:
+                self._update_pacer()
+                self.pacer.update_deltas(self.dl_deltas)
+
+            # streamed requests are handed over as soon as all requests before them are done
+            if self.stream and self.requests and self.requests[0].stream and not self.requests[0].dispatched:
+                self._dispatch(self.requests[0])
+
+        if self.skip_ahead:
+            if self.dl_deltas and len(self.dl_deltas) == self.dl_deltas.maxlen:
+                avg_delta = sum(self.dl_deltas) / len(self.dl_deltas)
+                # msgr.send_msg("Delta avg: {}".format(avg_delta), logging.DEBUG)
+                if avg_delta <= SUFFICIENT_DELTA:
+                    msgr.send_msg("Sufficient delta reached ({}) after {:.3f} seconds. Data processing started."
+                                  .format(avg_delta, time.time() - self.start_time))
+                    self.skip_ahead = False
+
+            if self.skip_ahead:
+                passed = time.time() - self.start_time
+                if passed > self.skip_timeout:
+                    msgr.send_msg("Skip ahead timed out after {:.3f} seconds. Data processing started."
+                                  .format(passed), logging.WARN)
+                    self.skip_ahead = False
+
+        if not len(self.requests):
+            # Should never happen, since there is always a next id.
+            # If it does, parent thread will end up restarting this from last saved point
+            msgr.send_msg('No requests left.. stopping..', logging.WARN)
+            self.stop()
+
+    def _update_pacer(self):
+        # settings can change while scanning
+        if config.request_delay is not None:
+            self.pacer.request_delay = config.request_delay
+        if config.smooth_delay is not None:
+            self.pacer.smooth = config.smooth_delay
+
+    def _get_timeout(self, free_conns):
+        """ :return: time to wait for transfers before checking the request queue again """
+        # wake up in time for the next request
+        timeout = 1.0
+        if self.req_queue and free_conns:
+            if self.flow.has_room() or self._head_retry_queued():
+                timeout = min(timeout, max(self.pacer.get_wait(self.last_request), 0.01))
+            else:
+                timeout = FLOW_POLL_INTERVAL
+        return timeout
+
+    def _on_stop(self):
+        self.running = False
+
+        # unblock consumers of streamed requests which will never finish
+        with self.requests_lock:
+            for req in self.requests:
+                req.cancel()
+                if not req.dispatched:
+                    req.release()
+
+        msgr.send_msg('Downloader stopped', logging.INFO)
+
+    def stop(self):
+        self.evt_stop.set()
+
+    def _dispatch(self, req):
+        req.dispatched = True
+        self.flow.put(req)
+
+    def add_request(self, next_id):
+        req = Request(next_id, skip_data=self.skip_ahead, stream=self.stream, flow=self.flow, buffers=self.buffers)
+
+        with self.requests_lock:
+            req.add_time = time.time()
+            req.seq = next(self.req_seq)
+            self.requests.append(req)
+
+        self._submit(req)
+
+    def _submit(self, req):
+        with self.req_queue_lock:
+            req.submit_time = time.time()
+            heapq.heappush(self.req_queue, (req.seq, req))
+
+    def _take_request(self):
+        """
+        Takes the unfinished request with minimal ID off the queue.
+        Assumes any request in queue was properly registered with add_request first, requires req_queue_lock
+        """
+        seq, req = heapq.heappop(self.req_queue)
+        return req
+
+    def get(self, timeout=None):
+        return self.flow.get(timeout)
+
+    def get_stats(self):
+        stats = {}
+
+        stats['last-req'] = self.last_request
+        stats['req-time'] = sum(self.req_time) / len(self.req_time) if len(self.req_time) else 0
+        stats['peek-time'] = sum(self.peek_time) / len(self.peek_time) if len(self.peek_time) else 0
+        stats['id-delta'] = sum(self.dl_deltas) / len(self.dl_deltas) if len(self.dl_deltas) else None
+        stats['queue-time'] = sum(self.queue_time) / len(self.queue_time) if len(self.queue_time) else 0
+        stats['req-delay-time'] = sum(self.req_delay_time) / len(self.req_delay_time) if len(self.req_delay_time) else 0
+        stats['delta-rate'] = sum(self.dps) / len(self.dps) if len(self.dps) else 0
+        stats.update(self.pacer.get_stats())
+        stats.update(self.buffers.get_stats())
+
+        return stats
+
+
+class Downloader(BaseDownloader):
+    """ Downloader transferring requests with a pycurl multi handle """
+
+    def __init__(self, start_id, conns=2, skip_timeout=120, stream=False, flow=None):
+        self.m = pycurl.CurlMulti()
+        self.handles = [self._create_handle() for i in range(conns)]
+        self.free_handles = deque(self.handles)
+
+        BaseDownloader.__init__(self, start_id, conns, skip_timeout, stream, flow)
+
     def _create_handle(self):
         c = pycurl.Curl()
 
@@ -164,52 +521,24 @@ class Downloader(Thread):
         return c
 
     def _prepare_handle(self, c, request):
-        c.setopt(pycurl.URL, URL.format(request.req_id))
+        c.setopt(pycurl.URL, self.url.format(request.req_id))
         c.setopt(pycurl.WRITEFUNCTION, functools.partial(request.write, self))
+        c.setopt(pycurl.HEADERFUNCTION, request.header)
         c.req = request
 
     def run(self):
         try:
-            msgr.send_msg('Downloader started', logging.INFO)
-            if self.skip_ahead:
-                msgr.send_msg('Skipping ahead.. please wait..')
-            # self.skip_ahead = False
-
-            self.stat_thread.start()
-
-            start_time = time.time()
+            self._on_start()
 
             while not self.evt_stop.is_set():
                 while not self.evt_stop.is_set():
                     with self.req_queue_lock:
-                        if self.req_queue and self.free_handles and \
-                                (not self.last_request or time.time() - self.last_request >= config.request_delay):
-
-                            # get unfinished request with minimal ID
-                            # assumes any request in queue was properly registered with add_request first
-                            req_sorted = sorted(self.req_queue, key=lambda r: self.requests.index(r))
-                            req = req_sorted[0]
-                            self.req_queue.remove(req)
-
-                            # req = self.req_queue.pop(0)  # TODO: choose min ID (only needed if we resubmit failed attempts)
-                            handle = self.free_handles.pop(0)
+                        if self.free_handles and self._can_send():
+                            req = self._take_request()
+                            handle = self.free_handles.popleft()
                             self._prepare_handle(handle, req)
-
-                            if self.last_request:
-                                delta = time.time() - self.last_request
-                            else:
-                                delta = 0
-
-                            add_delay = time.time() - req.submit_time
-                            self.queue_time.append(add_delay)
-
+                            self._on_send(req)
                             self.m.add_handle(handle)
-                            self.last_request = time.time()
-                            req.start_time = self.last_request
-
-                            self.req_delay_time.append(delta)
-
-                            # msgr.send_msg('Added: {}, delta: {:.3f}s, add delay: {:.3f}s'.format(req.req_id, delta, add_delay), logging.DEBUG)
 
                     ret, num_handles = self.m.perform()
                     if ret != pycurl.E_CALL_MULTI_PERFORM: break
@@ -227,42 +556,8 @@ class Downloader(Thread):
                         #               round(cinfo['speed-download']/1024), round(cinfo['size-download']/1024),
                         #               cinfo['starttransfer-time'], cinfo['pretransfer-time']))
 
-                        if cinfo['http-code'] == 200:
-                            if not c.req.submitted_next:
-                                next_id = c.req.peek_id()
-                                if next_id:
-                                    msgr.send_msg('Full peek was required for ID: {}'.format(c.req.req_id), logging.INFO)
-                                    self.add_request(next_id)
-                                    c.req.submitted_next = next_id
-                                    c.req.peek_time = time.time() - c.req.start_time
-
-                            if c.req.submitted_next:
-                                c.req.finished = True
-                            else:
-                                msgr.send_msg('Request successful for ID {}, but next ID was not found. Redownloading..'
-                                              .format(c.req.req_id), logging.INFO)
-                        else:
-                            try:
-                                err_data = json.loads(c.req.buffer.getvalue().decode())['error']
-                                msgr.send_msg('Request for ID {} failed. {} - Code: {}, Message: {}'
-                                              .format(c.req.req_id, cinfo['http-code'], err_data['code'], err_data['message']), logging.WARN)
-                            except Exception:
-                                msgr.send_msg('Request for ID {} failed. {} - {}'.format(c.req.req_id, cinfo['http-code'], c.req.buffer.getvalue().decode()), logging.WARN)
-
-                        # if c.req.finished:
-                        #     self.free_handles.append(c)
-                        # else:
-                        #     c.req.reset()
-                        #     self.m.add_handle(c)
                         self.free_handles.append(c)
-
-                        if not c.req.finished:
-                            c.req.reset()
-                            self._submit(c.req)
-                        else:
-                            self.req_time.append(cinfo['total-time'])
-                            self.peek_time.append(c.req.peek_time)
-
+                        self._on_response(c.req, cinfo['http-code'], cinfo['total-time'])
 
                     for c, errno, errmsg in err_list:
                         self.m.remove_handle(c)
@@ -273,105 +568,27 @@ class Downloader(Thread):
                         #     c.req.reset()
                         #     self.m.add_handle(c)
                         self.free_handles.append(c)
-
-                        if not c.req.finished:
-                            msgr.send_msg("Failed: {} - Code: {}, {}. Redownloading.."
-                                          .format(c.req.req_id, errno, errmsg), logging.INFO)
-                            c.req.reset()
-                            self._submit(c.req)
-                        else:
-                            cinfo = info(c)
-                            self.req_time.append(cinfo['total-time'])
-                            self.peek_time.append(c.req.peek_time)
+                        self._on_error(c.req, errno, errmsg, c.getinfo(pycurl.TOTAL_TIME))
 
                     if num_q == 0:
                         break
 
-                with self.requests_lock:
-                    while self.requests and self.requests[0].finished:
-                        req = self.requests.pop(0)
-
-                        delta = get_delta(req.req_id, req.submitted_next)
-                        self.dl_deltas.append(delta)
-                        with self.delta_lock:
-                            self.delta_count += delta
-
-                        if not req.skip_data:
-                            try:
-                                self.res_queue.put((req.req_id, req.buffer), timeout=1)
-                            except Full:
-                                msgr.send_msg('Result queue is full.. waiting for consumer to free slots..', logging.WARN)
-                                self.res_queue.put((req.req_id, req.buffer))
-
-                if self.skip_ahead:
-                    if self.dl_deltas and len(self.dl_deltas) == self.dl_deltas.maxlen:
-                        avg_delta = sum(self.dl_deltas) / len(self.dl_deltas)
-                        # msgr.send_msg("Delta avg: {}".format(avg_delta), logging.DEBUG)
-                        if avg_delta <= SUFFICIENT_DELTA:
-                            msgr.send_msg("Sufficient delta reached ({}) after {:.3f} seconds. Data processing started."
-                                          .format(avg_delta, time.time() - start_time))
-                            self.skip_ahead = False
-
-                    if self.skip_ahead:
-                        passed = time.time() - start_time
-                        if passed > self.skip_timeout:
-                            msgr.send_msg("Skip ahead timed out after {:.3f} seconds. Data processing started."
-                                          .format(passed), logging.WARN)
-                            self.skip_ahead = False
-
-                self.m.select(1.0)
-
-                if not len(self.requests):
-                    # Should never happen, since there is always a next id.
-                    # If it does, parent thread will end up restarting this from last saved point
-                    msgr.send_msg('No requests left.. stopping..', logging.WARN)
-                    self.stop()
+                self._handle_finished()
+
+                self.m.select(self._get_timeout(len(self.free_handles)))
         except Exception as e:
             msgr.send_msg("Unexpected error occurred while downloading: {}. Error details logged to file.".format(e),
                           logging.ERROR)
             logexception()
         finally:
             self._close()
-            msgr.send_msg('Downloader stopped', logging.INFO)
-
-    def stop(self):
-        self.evt_stop.set()
+            self._on_stop()
 
     def _close(self):
         self.m.close()
         for handle in self.handles:
             handle.close()
 
-    def add_request(self, next_id):
-        req = Request(next_id, skip_data=self.skip_ahead)
-
-        with self.requests_lock:
-            req.add_time = time.time()
-            self.requests.append(req)
-
-        self._submit(req)
-
-    def _submit(self, req):
-        with self.req_queue_lock:
-            req.submit_time = time.time()
-            self.req_queue.append(req)
-
-    def get(self, block=True, timeout=None):
-        return self.res_queue.get(block, timeout)
-
-    def get_stats(self):
-        stats = {}
-
-        stats['last-req'] = self.last_request
-        stats['req-time'] = sum(self.req_time) / len(self.req_time) if len(self.req_time) else 0
-        stats['peek-time'] = sum(self.peek_time) / len(self.peek_time) if len(self.peek_time) else 0
-        stats['id-delta'] = sum(self.dl_deltas) / len(self.dl_deltas) if len(self.dl_deltas) else None
-        stats['queue-time'] = sum(self.queue_time) / len(self.queue_time) if len(self.queue_time) else 0
-        stats['req-delay-time'] = sum(self.req_delay_time) / len(self.req_delay_time) if len(self.req_delay_time) else 0
-        stats['delta-rate'] = sum(self.dps) / len(self.dps) if len(self.dps) else 0
-
-        return stats
-
 
 if __name__ == '__main__':
 
@@ -393,7 +610,7 @@ if __name__ == '__main__':
 
     time.sleep(100)
     dler.stop()
-    print('Requests num: {}, finished requests: {}, result: {}'.format(len(dler.requests), len([req for req in dler.requests if req.finished]), dler.res_queue.qsize()))
+    print('Requests num: {}, finished requests: {}, result: {}'.format(len(dler.requests), len([req for req in dler.requests if req.finished]), len(dler.flow.pages)))
 
     print('\n-- Requests --\n')
     for req in dler.requests:
@@ -401,13 +618,10 @@ if __name__ == '__main__':
 
     print('\n-- Results --\n')
     prev_id = None
-    try:
-        while True:
-            req_id, data = dler.res_queue.get_nowait()
+    while dler.flow.pages:
+        req = dler.flow.pages.popleft()
 
-            delta = get_delta(prev_id, req_id) if prev_id else 0
-            print('{}: {} KB, Delta: {}'.format(req_id, round(len(data.getvalue())/1024), delta))
+        delta = get_delta(prev_id, req.req_id) if prev_id else 0
+        print('{}: {} KB, Delta: {}'.format(req.req_id, round(req.size/1024), delta))
 
-            prev_id = req_id
-    except Empty:
-        pass
+        prev_id = req.req_id
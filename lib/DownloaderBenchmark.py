@@ -0,0 +1,117 @@
+"""
+Downloader backend benchmark against a local server, no requests are sent to the API.
+Usage: python -m lib.DownloaderBenchmark <page file> [<seconds>] [<connections>]
+The server runs in a process of its own and answers every request with the given page, chained to the next ID.
+Backends download without delay for the given time, pages are released as soon as they are handed over.
+CPU time is that of the benchmark process, thus of the backend and the handover.
+"""
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+from threading import Thread
+from urllib.parse import urlsplit, parse_qs
+
+from lib.AsyncDownloader import AsyncDownloader
+from lib.Downloader import Downloader
+from lib.FlowControl import FlowControl
+from lib.Utility import config
+
+_NEXT_ID_REGEX = re.compile(rb'"next_change_id"\s*:\s*"[^"]*"')
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    page = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        req_id = parse_qs(urlsplit(self.path).query)['id'][0]
+        next_id = '{}-0-0-0-0'.format(int(req_id.split('-')[0]) + 1)
+        body = _NEXT_ID_REGEX.sub('"next_change_id":"{}"'.format(next_id).encode(), self.page, count=1)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PageServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # backends drop their connections when they stop
+        pass
+
+
+def serve_page(fname, port_queue):
+    with open(fname, 'rb') as f:
+        PageHandler.page = f.read()
+
+    server = PageServer(('127.0.0.1', 0), PageHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def consume(flow, counts):
+    while True:
+        req = flow.get()
+        if req is None:
+            break
+        counts[0] += 1
+        counts[1] += req.size
+        req.release()
+
+
+def benchmark(backends, url, seconds, conns):
+    for name, downloader_cls in backends:
+        flow = FlowControl(1024 ** 3)
+        dl = downloader_cls('0-0-0-0-0', conns=conns, flow=flow)
+        dl.url = url
+
+        counts = [0, 0]  # pages, bytes
+        consumer = Thread(target=consume, args=(flow, counts))
+        consumer.start()
+
+        cpu = time.process_time()
+        start = time.perf_counter()
+        dl.start()
+        time.sleep(seconds)
+        dl.stop()
+        dl.join()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+
+        flow.close()
+        consumer.join()
+
+        pages, size = counts
+        stats = dl.get_stats()
+        print('{:<10} {:>8.1f} pages/s {:>8.1f} MB/s {:>8.1f}ms per request {:>8.1f}ms CPU per page'.format(
+            name, pages / elapsed, size / elapsed / 1024 ** 2, stats['req-time'] * 1000,
+            cpu / max(pages, 1) * 1000))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    # requests are sent as fast as possible
+    config.request_delay = 0
+    config.smooth_delay = False
+
+    ports = Queue()
+    server_process = Process(target=serve_page, args=(sys.argv[1], ports), daemon=True)
+    server_process.start()
+    try:
+        server_url = 'http://127.0.0.1:{}/public-stash-tabs?id={{}}'.format(ports.get())
+        print('Page: {}, connections: {}, {:.0f}s per backend'.format(sys.argv[1], connections, duration))
+        benchmark([('pycurl', Downloader), ('asyncio', AsyncDownloader)], server_url, duration, connections)
+    finally:
+        server_process.terminate()
@@ -0,0 +1,129 @@
+"""
+Filter matching benchmark over recorded pages.
+Usage: python -m lib.FilterBenchmark <league> <page file> [<page file> ...]
+Page files are raw public stash API responses, such as those dumped to the log folder on parse errors.
+"""
+import json
+import sys
+import time
+
+from lib.CurrencyManager import cm
+from lib.FilterManager import fm
+from lib.ItemCollection import ItemCollection
+from lib.ItemFilter import Filter
+from lib.ItemHelper import Item
+from lib.StashHelper import get_stash_price
+from lib.Utility import config
+
+# fields Item.__init__ computed before they were computed on demand
+EAGER_FIELDS = ('links_count', 'sockets_count', 'c_base', 'c_name', 'implicit', 'explicit', 'enchant', 'craft',
+                'crafted', 'enchanted', 'modcount')
+
+
+def load_items(fnames, league):
+    """ :return: (item, stash price) of every item in league tabs of the given pages """
+    items = []
+    for fname in fnames:
+        with open(fname, encoding='utf-8') as f:
+            data = json.load(f)
+
+        for stash in data['stashes']:
+            if stash['public'] and stash['items'] and stash['items'][0]['league'] == league:
+                stash_price = get_stash_price(stash)
+                items.extend((item, stash_price) for item in stash['items'])
+
+    return items
+
+
+def first_match(filters, check):
+    def match(item):
+        for i, fltr in enumerate(filters):
+            if check(fltr, item):
+                return i
+        return None
+    return match
+
+
+def get_methods(index):
+    """ :return: matching methods by name, each returns the position of the first matching filter """
+    filters = index.filters
+
+    def match_index(item):
+        match = index.match(item)
+        return match[0] if match else None
+
+    return [
+        ('checkItemAll', first_match(filters, lambda fltr, item: fltr.checkItemAll(item))),
+        ('predicate', first_match(filters, lambda fltr, item: fltr.predicate(fltr, item))),
+        ('index', match_index),
+    ]
+
+
+def benchmark(items, methods, rounds=3):
+    expected = None
+
+    for name, method in methods:
+        best = None
+        for _ in range(rounds):
+            # items compute their properties on demand, every round gets new ones
+            cur_items = [Item(item, stash_price) for item, stash_price in items]
+            start = time.perf_counter()
+            results = [method(item) for item in cur_items]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        if expected is None:
+            expected = results
+        status = 'OK' if results == expected else 'MISMATCH'
+
+        print('{:<15} {:>9.1f}ms {:>12.0f} items/s  matches: {:<6} {}'.format(
+            name, best * 1000, len(items) / max(best, 1e-9), len([r for r in results if r is not None]), status))
+
+
+def eager_item(item, stash_price):
+    """ :return: Item with the fields Item.__init__ used to compute up front already computed """
+    cur_item = Item(item, stash_price)
+    for field in EAGER_FIELDS:
+        getattr(cur_item, field)
+    return cur_item
+
+
+def benchmark_items(items, index, rounds=3):
+    """
+    Item construction and matching throughput of a single core, as done by a parser worker,
+    for items computing their fields up front as they used to and on demand
+    """
+    for name, item_cls in (('eager items', eager_item), ('lazy items', Item)):
+        best_build, best_total = None, None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            cur_items = [item_cls(item, stash_price) for item, stash_price in items]
+            built = time.perf_counter()
+            index.match_all(cur_items)
+            end = time.perf_counter()
+
+            best_build = built - start if best_build is None else min(best_build, built - start)
+            best_total = end - start if best_total is None else min(best_total, end - start)
+
+        print('{:<15} {:>9.1f}ms {:>12.0f} items/s per core, {:>12.0f} items/s constructed'.format(
+            name, best_total * 1000, len(items) / max(best_total, 1e-9), len(items) / max(best_build, 1e-9)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    config.load()
+    cm.load()
+    Filter.init()
+    ItemCollection.init()
+    fm.loadConfig()
+    fm.loadAutoFilters()
+    fm.loadUserFilters()
+    fm.compileFilters()
+
+    bench_items = load_items(sys.argv[2:], sys.argv[1])
+    print('Items: {}, Active filters: {}'.format(len(bench_items), len(fm.getActiveFilters())))
+    benchmark(bench_items, get_methods(fm.filterIndex))
+    benchmark_items(bench_items, fm.filterIndex)
@@ -0,0 +1,179 @@
+import functools
+import operator
+
+from lib.FilterMatrix import FilterMatrix
+from lib.NameMatcher import NameMatcher
+
+
+class FilterIndex:
+    """
+    Dispatches items to the active filters that can match them.
+    Filters matching exact item names only are looked up by name, the rest are checked for every item
+    of a class and rarity they can apply to.
+    With many name fragments, filters matching names are also looked up by the fragments the item name contains,
+    these are found in one pass for all filters.
+    Matching keeps the priority order of the active filters, first match wins.
+    Items no filter can match are rejected beforehand, by bounds common to all filters.
+    Large filter sets are matched a block of items at a time instead, see FilterMatrix.
+    """
+
+    # below this many fragments, checking each fragment is faster than the name matcher
+    NAME_MATCHER_MIN = 32
+
+    def __init__(self, filters=()):
+        self.filters = list(filters)
+        self.by_name = {}  # exact item name to (position, filter) in priority order
+        self.by_fragment = {}  # name fragment to (position, filter) in priority order
+        self.residual = []  # (position, filter) of filters which cannot be looked up
+
+        fragments = {name for fltr in self.filters if fltr.name_parts for name in fltr.name_parts}
+        self.name_matcher = NameMatcher(fragments) if len(fragments) >= self.NAME_MATCHER_MIN else None
+
+        for pos, fltr in enumerate(self.filters):
+            names = self._get_exact_names(fltr)
+            if names:
+                for name in names:
+                    self.by_name.setdefault(name, []).append((pos, fltr))
+            elif self.name_matcher is not None and fltr.name_parts:
+                for name in fltr.name_exact:
+                    self.by_name.setdefault(name, []).append((pos, fltr))
+                for name in fltr.name_parts:
+                    self.by_fragment.setdefault(name, []).append((pos, fltr))
+            else:
+                self.residual.append((pos, fltr))
+
+        # bounds are None when at least one filter is unbounded
+        self.buyout = self._get_bound(self.filters, 'buyout', lambda vals: vals[0] if len(set(vals)) == 1 else None)
+        self.price_max = self._get_bound(self.filters, 'price_max', max)
+        self.rarities = self._get_bound(self.filters, 'rarity', lambda vals: frozenset().union(*vals))
+        self.iclass = self._get_bound(self.filters, 'iclass', lambda vals: functools.reduce(operator.or_, vals))
+
+        # residual filters that can apply to an item, by (item class, rarity), filled as keys are encountered.
+        # keys only include the fields residual filters have criteria for
+        self.bucket_iclass = any(fltr.iclass is not None for pos, fltr in self.residual)
+        self.bucket_rarity = any(fltr.rarity is not None for pos, fltr in self.residual)
+        self.buckets = {}
+
+        # batch matching engine for large counts of filters checked for every item, when NumPy is available
+        self.matrix = FilterMatrix(self) if FilterMatrix.isAvailable(len(self.residual)) else None
+
+    def __len__(self):
+        return len(self.filters)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buckets'] = {}
+        return state
+
+    @staticmethod
+    def _get_bound(filters, key, union):
+        vals = [fltr.comp.get(key) for fltr in filters]
+        if not vals or any(val is None for val in vals):
+            return None
+        return union(vals)
+
+    def accepts(self, item):
+        """ :return: False if no filter can match the item """
+        if self.buyout is not None and self.buyout != item.buyout:
+            return False
+        if self.price_max is not None and item.c_price is not None and item.c_price > self.price_max:
+            return False
+        if self.rarities is not None and item.rarity not in self.rarities:
+            return False
+        if self.iclass is not None and self.iclass & item.iclass != item.iclass:
+            return False
+        return True
+
+    @staticmethod
+    def _get_exact_names(fltr):
+        """ :return: the item names a filter is limited to, None if it isn't limited to exact names """
+        names = fltr.comp.get('name')
+        if not names:
+            return None
+
+        exact = set()
+        for name in names:
+            if name:
+                if name[0] == name[-1] == '"' and len(name) > 1:
+                    exact.add(name[1:-1])
+                else:
+                    return None
+
+        return exact or None
+
+    def _get_residual(self, item):
+        """ :return: (position, filter) of residual filters whose class and rarity criteria the item can meet """
+        if not (self.bucket_iclass or self.bucket_rarity):
+            return self.residual
+
+        key = (item.iclass if self.bucket_iclass else None, item.rarity if self.bucket_rarity else None)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            iclass, rarity = key
+            bucket = self.buckets[key] = [
+                (pos, fltr) for pos, fltr in self.residual
+                if (iclass is None or fltr.iclass is None or fltr.iclass & iclass == iclass) and
+                   (rarity is None or fltr.rarity is None or rarity in fltr.rarity)]
+        return bucket
+
+    def _get_candidates(self, candidates, fragments):
+        """ :return: (position, filter) of filters looked up by name or by any of the fragments, by position """
+        merged = set(candidates) if candidates else set()
+        for fragment in fragments:
+            merged.update(self.by_fragment.get(fragment, ()))
+        return sorted(merged, key=operator.itemgetter(0))
+
+    def getCandidates(self, item):
+        """ :return: (position, filter) of every filter the item is checked against by match, by position """
+        if not self.accepts(item):
+            return []
+
+        candidates = self.by_name.get(item.c_name, [])
+        if self.name_matcher is not None:
+            item.name_matcher = self.name_matcher
+            if item.name_matches:
+                candidates = self._get_candidates(candidates, item.name_matches)
+
+        return sorted(candidates + self._get_residual(item), key=operator.itemgetter(0))
+
+    def match(self, item):
+        """ :return: (position, filter) of the first filter matching the item, None if there is no match """
+        if not self.accepts(item):
+            return None
+
+        candidates = self.by_name.get(item.c_name)
+        residual = self._get_residual(item)
+
+        if self.name_matcher is not None:
+            item.name_matcher = self.name_matcher
+            if item.name_matches:
+                candidates = self._get_candidates(candidates, item.name_matches)
+
+        if candidates is None:
+            for pos, fltr in residual:
+                if fltr.predicate(fltr, item):
+                    return pos, fltr
+            return None
+
+        # merge both lists by position
+        i, n = 0, len(residual)
+        for pos, fltr in candidates:
+            while i < n and residual[i][0] < pos:
+                res_pos, res_fltr = residual[i]
+                if res_fltr.predicate(res_fltr, item):
+                    return res_pos, res_fltr
+                i += 1
+            if fltr.predicate(fltr, item):
+                return pos, fltr
+
+        for res_pos, res_fltr in residual[i:]:
+            if res_fltr.predicate(res_fltr, item):
+                return res_pos, res_fltr
+
+        return None
+
+    def match_all(self, items):
+        """ :return: match of every item, as returned by match """
+        if self.matrix is not None:
+            return self.matrix.match_all(items)
+        return [self.match(item) for item in items]
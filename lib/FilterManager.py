@@ -14,7 +14,9 @@ from urllib.parse import urljoin
 import jsonschema
 
 from lib.CompiledFilter import CompiledFilter
+from lib.CriteriaStats import crit_stats
 from lib.CurrencyManager import cm
+from lib.FilterIndex import FilterIndex
 from lib.ItemClass import ItemClass
 from lib.ItemFilter import _ITEM_TYPE, Filter, FilterEncoder, _NAME_TO_TYPE, FilterPriority
 from lib.ItemHelper import ItemRarity, ItemType
@@ -108,6 +110,8 @@ class FilterManager:
         self.autoFilters = []
         self.compiledFilters = []
         self.activeFilters = []
+        self.filterIndex = FilterIndex()
+        self.version = 0  # incremented whenever active filters change
 
         self.disabled_categories = []
         self.price_threshold = self.DEFAULT_PRICE_THRESHOLD
@@ -436,8 +440,10 @@ class FilterManager:
                 # configuration is valid yet compile failed, stop
                 self.compiledFilters = []
                 self.activeFilters = []
+                self.filterIndex = FilterIndex()
                 self.compiled_item_prices = {}
                 self.compiled_filter_prices = {}
+                self.version += 1
                 if isinstance(e, AppException):
                     msgr.send_msg(e, logging.ERROR)
                 else:
@@ -491,11 +497,14 @@ class FilterManager:
         active_filters = [cf for cf in filters if cf.enabled]
         active_filters.sort(key=lambda cf: cf.fltr.priority, reverse=True)
 
+        # checks are ordered by the criteria rejection rates sampled so far
         for cf in filters:
-            cf.finalize()
+            cf.finalize(crit_stats)
 
         self.activeFilters = active_filters
+        self.filterIndex = FilterIndex(active_filters)
         self.compiledFilters = filters
+        self.version += 1
 
         self.item_prices = item_prices
         self.compiled_item_prices = compiled_item_prices
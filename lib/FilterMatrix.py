@@ -0,0 +1,215 @@
+import operator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _get_level(item):
+    return max(item.level, item.tier)
+
+
+# item fields of numeric criteria
+_FIELDS = {
+    'price': operator.attrgetter('c_price'),
+    'ilvl': operator.attrgetter('ilvl'),
+    'links': operator.attrgetter('links_count'),
+    'sockets': operator.attrgetter('sockets_count'),
+    'stacksize': operator.attrgetter('stacksize'),
+    'modcount': operator.attrgetter('modcount'),
+    'level': _get_level,
+    'exp': operator.attrgetter('exp'),
+    'quality': operator.attrgetter('quality'),
+    'es': operator.attrgetter('es'),
+    'armour': operator.attrgetter('armour'),
+    'evasion': operator.attrgetter('evasion'),
+    'dps': operator.attrgetter('dps'),
+    'edps': operator.attrgetter('edps'),
+    'pdps': operator.attrgetter('pdps'),
+    'aps': operator.attrgetter('aps'),
+    'crit': operator.attrgetter('crit'),
+    'block': operator.attrgetter('block'),
+}
+
+# order columns are computed in, fields parsed from item properties are the costly ones
+_FIELD_ORDER = {field: i for i, field in enumerate(_FIELDS)}
+
+# numeric criteria to (field, is lower bound)
+_CRITERIA = {
+    'price_min': ('price', True),
+    'price_max': ('price', False),
+    'ilvl_min': ('ilvl', True),
+    'ilvl_max': ('ilvl', False),
+    'links_min': ('links', True),
+    'links_max': ('links', False),
+    'sockets_min': ('sockets', True),
+    'sockets_max': ('sockets', False),
+    'stacksize_min': ('stacksize', True),
+    'stacksize_max': ('stacksize', False),
+    'modcount_min': ('modcount', True),
+    'modcount_max': ('modcount', False),
+    'level_min': ('level', True),
+    'level_max': ('level', False),
+    'exp': ('exp', True),
+    'quality_min': ('quality', True),
+    'quality_max': ('quality', False),
+    'es_min': ('es', True),
+    'es_max': ('es', False),
+    'armour_min': ('armour', True),
+    'armour_max': ('armour', False),
+    'evasion_min': ('evasion', True),
+    'evasion_max': ('evasion', False),
+    'dps_min': ('dps', True),
+    'dps_max': ('dps', False),
+    'edps_min': ('edps', True),
+    'edps_max': ('edps', False),
+    'pdps_min': ('pdps', True),
+    'pdps_max': ('pdps', False),
+    'aps_min': ('aps', True),
+    'aps_max': ('aps', False),
+    'crit_min': ('crit', True),
+    'crit_max': ('crit', False),
+    'block_min': ('block', True),
+    'block_max': ('block', False),
+}
+
+
+class FilterMatrix:
+    """
+    Batch matching engine, requires NumPy.
+    Numeric criteria of all filters are checked at once for a block of items, by comparing item field columns
+    to filter threshold rows. Together with exact names, this gives a candidate mask of items by filters.
+    Filters are then checked by their predicate only for the candidates of an item, in priority order.
+    Field values are taken as missing when an item has none, missing values pass every threshold,
+    as they would with the filter's predicate.
+    Fields are only computed for items which are still candidates of a filter bounding them,
+    cheap fields first, item class and rarity narrow the candidates beforehand.
+    """
+
+    # items per mask, bounds mask size to BLOCK_SIZE * filter count
+    BLOCK_SIZE = 256
+    # below this many filters the index cannot look up by name, the filter index matches faster on its own
+    MIN_FILTERS = 1000
+
+    def __init__(self, index):
+        self.index = index
+        filters = index.filters
+        count = len(filters)
+
+        # lower and upper bounds of every filter, by field
+        bounds = {}
+        for key, (field, is_lower) in _CRITERIA.items():
+            for pos, fltr in enumerate(filters):
+                val = getattr(fltr, key)
+                if val is not None:
+                    if field not in bounds:
+                        bounds[field] = np.full(count, -np.inf), np.full(count, np.inf)
+                    bounds[field][0 if is_lower else 1][pos] = val
+
+        # (field, lower bounds, upper bounds, bounded filters) of fields with at least one bounded filter,
+        # None for unused bounds. In the order of _FIELDS, costly fields go last
+        self.bounds = [(field,
+                        lower if np.isfinite(lower).any() else None,
+                        upper if np.isfinite(upper).any() else None,
+                        np.isfinite(lower) | np.isfinite(upper))
+                       for field, (lower, upper) in sorted(bounds.items(), key=lambda b: _FIELD_ORDER[b[0]])]
+
+        # filters that can apply to an item, by (item class, rarity), filled as keys are encountered.
+        # keys only include the fields filters have criteria for
+        self.by_iclass = any(fltr.iclass is not None for fltr in filters)
+        self.by_rarity = any(fltr.rarity is not None for fltr in filters)
+        self.applicable = {}
+
+        # filters limited to exact names only match items with one of these names
+        self.named = np.zeros(count, dtype=bool)
+        by_name = {}
+        for pos, fltr in enumerate(filters):
+            if fltr.name_exact and not fltr.name_parts:
+                self.named[pos] = True
+                for name in fltr.name_exact:
+                    by_name.setdefault(name, []).append(pos)
+        self.by_name = {name: np.array(positions) for name, positions in by_name.items()}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['applicable'] = {}
+        return state
+
+    @classmethod
+    def isAvailable(cls, filter_count):
+        return np is not None and filter_count >= cls.MIN_FILTERS
+
+    def match_all(self, items):
+        """ :return: match of every item, as returned by FilterIndex.match """
+        index = self.index
+        filters = index.filters
+        results = [None] * len(items)
+
+        accepted = [i for i, item in enumerate(items) if index.accepts(item)]
+        for start in range(0, len(accepted), self.BLOCK_SIZE):
+            block = accepted[start:start + self.BLOCK_SIZE]
+            block_items = [items[i] for i in block]
+            mask = self._get_mask(block_items)
+
+            for row, item in enumerate(block_items):
+                item.name_matcher = index.name_matcher
+                for pos in np.flatnonzero(mask[row]).tolist():
+                    fltr = filters[pos]
+                    if fltr.predicate(fltr, item):
+                        results[block[row]] = pos, fltr
+                        break
+
+        return results
+
+    def _get_mask(self, items):
+        mask = np.empty((len(items), len(self.named)), dtype=bool)
+        mask[:] = ~self.named
+        for row, item in enumerate(items):
+            positions = self.by_name.get(item.c_name)
+            if positions is not None:
+                mask[row, positions] = True
+            if self.by_iclass or self.by_rarity:
+                mask[row] &= self._get_applicable(item)
+
+        for field, lower, upper, bounded in self.bounds:
+            # items none of their candidates bound the field for are left out, their column values go unused
+            rows = (mask & bounded).any(axis=1)
+            if not rows.any():
+                continue
+
+            col = self._get_column(items, _FIELDS[field], rows)
+            missing = np.isnan(col)
+            # missing values are never rejected
+            if lower is not None:
+                mask &= np.where(missing, np.inf, col)[:, None] >= lower
+            if upper is not None:
+                mask &= np.where(missing, -np.inf, col)[:, None] <= upper
+
+        return mask
+
+    def _get_applicable(self, item):
+        """ :return: mask of the filters whose class and rarity criteria the item can meet """
+        key = (item.iclass if self.by_iclass else None, item.rarity if self.by_rarity else None)
+        applicable = self.applicable.get(key)
+        if applicable is None:
+            iclass, rarity = key
+            applicable = self.applicable[key] = np.array(
+                [(iclass is None or fltr.iclass is None or fltr.iclass & iclass == iclass) and
+                 (rarity is None or fltr.rarity is None or rarity in fltr.rarity)
+                 for fltr in self.index.filters], dtype=bool)
+        return applicable
+
+    @staticmethod
+    def _get_column(items, getter, rows):
+        """ :param rows: mask of the items to get the field of, the others are left missing """
+        col = np.full(len(items), np.nan)
+        for i in np.flatnonzero(rows).tolist():
+            item = items[i]
+            try:
+                val = getter(item)
+            except Exception:
+                # left for the predicate to handle, as it would without the matrix
+                val = None
+            col[i] = np.nan if val is None else val
+        return col
@@ -0,0 +1,129 @@
+import threading
+import time
+
+# profiler of the filter index loaded by a worker process
+_profiler = None
+
+
+class FilterProfiler:
+    """
+    Records evaluations, time spent, hits and rejection stages of every filter of a worker's filter index.
+    Installed by replacing filter predicates with timed staged predicates.
+    Filters the index rules out beforehand are not evaluated, thus not counted.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.stats = {}  # filter position to [evaluations, time, hits, rejections by stage]
+
+        for pos, fltr in enumerate(index.filters):
+            fltr.predicate = self._getPredicate(pos, fltr.getStagedPredicate())
+
+    def _getPredicate(self, pos, staged):
+        stats = self.stats
+        perf_counter = time.perf_counter
+
+        def predicate(fltr, item):
+            start = perf_counter()
+            stage = staged(fltr, item)
+            elapsed = perf_counter() - start
+
+            entry = stats.get(pos)
+            if entry is None:
+                entry = stats[pos] = [0, 0, 0, {}]
+            entry[0] += 1
+            entry[1] += elapsed
+
+            if stage is None:
+                entry[2] += 1
+                return True
+
+            entry[3][stage] = entry[3].get(stage, 0) + 1
+            return False
+
+        return predicate
+
+    def collect(self):
+        """ :return: statistics recorded since the last call, by filter position """
+        stats = dict(self.stats)
+        self.stats.clear()
+        return stats
+
+
+def profile_index(index):
+    """
+    Profiles a filter index loaded by a worker process, unless it already is
+    :return: profiler of the index
+    """
+    global _profiler
+
+    if _profiler is None or _profiler.index is not index:
+        _profiler = FilterProfiler(index)
+    return _profiler
+
+
+class FilterProfile:
+    """ Filter statistics reported by the workers, aggregated by filter title """
+
+    DUMP_FNAME = "log\\filter-profile.txt"
+
+    def __init__(self):
+        self.start = time.time()
+        self.stats = {}  # title to [evaluations, time, hits, rejections by stage]
+        self.lock = threading.Lock()
+
+    def add(self, filters, stats):
+        """
+        :param filters: filters of the snapshot the statistics were recorded with
+        :param stats: statistics collected by a worker profiler
+        """
+        with self.lock:
+            for pos, (evals, elapsed, hits, stages) in stats.items():
+                title = filters[pos].getDisplayTitle()
+                entry = self.stats.get(title)
+                if entry is None:
+                    entry = self.stats[title] = [0, 0, 0, {}]
+                entry[0] += evals
+                entry[1] += elapsed
+                entry[2] += hits
+                for stage, count in stages.items():
+                    entry[3][stage] = entry[3].get(stage, 0) + count
+
+    def get_summary(self):
+        """
+        :return: list of (title, evaluations, average time, total time, hits per hour, rejections by stage),
+        costliest filters first
+        """
+        hours = max(time.time() - self.start, 1) / 3600
+        with self.lock:
+            summary = [(title, evals, elapsed / evals, elapsed, hits / hours, dict(stages))
+                       for title, (evals, elapsed, hits, stages) in self.stats.items()]
+        summary.sort(key=lambda entry: entry[3], reverse=True)
+        return summary
+
+    def get_stats(self):
+        stats = {}
+
+        summary = self.get_summary()
+        if summary:
+            total = sum(entry[3] for entry in summary)
+            stats['filter-costliest'] = summary[0][0]
+            stats['filter-costliest-share'] = summary[0][3] / total if total else 0
+
+        return stats
+
+    def dump(self, fname=DUMP_FNAME):
+        summary = self.get_summary()
+        lines = ['Filter profile, {:.1f} hours'.format((time.time() - self.start) / 3600), '']
+        lines.append('{:>12} {:>10} {:>10} {:>10}  {:<40} {}'.format(
+            'Evaluations', 'Avg (us)', 'Total (s)', 'Hits/hour', 'Filter', 'Rejections'))
+
+        for title, evals, avg, elapsed, hits_rate, stages in summary:
+            rejections = sum(stages.values())
+            stages = ', '.join('{} {:.0%}'.format(stage, count / rejections)
+                               for stage, count in sorted(stages.items(), key=lambda s: s[1], reverse=True))
+            lines.append('{:>12} {:>10.2f} {:>10.3f} {:>10.1f}  {:<40} {}'.format(
+                evals, avg * 1e6, elapsed, hits_rate, title, stages))
+
+        with open(fname, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
@@ -0,0 +1,103 @@
+import pickle
+
+from lib.CurrencyManager import cm
+from lib.FilterManager import fm
+from lib.PageBuffer import shared_memory
+
+# snapshot loaded by a worker process: (version, filter index, c_budget)
+_loaded = None
+
+
+class SnapshotRef:
+    """ Picklable reference to a filters snapshot, sent to the workers with every task """
+    __slots__ = ('version', 'name', 'size', 'data')
+
+    def __init__(self, version, name=None, size=0, data=None):
+        self.version = version
+        self.name = name
+        self.size = size
+        self.data = data
+
+    def __getstate__(self):
+        return self.version, self.name, self.size, self.data
+
+    def __setstate__(self, state):
+        self.version, self.name, self.size, self.data = state
+
+
+class FilterSnapshot:
+    """
+    Active filters, budget and currency information as seen by the workers.
+    Pickled once per change and stored in shared memory, workers reload it only when the version changes.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.key = None
+        self.data = None
+        self.filters = []
+        self.ref = None
+        self.seg = None
+
+    def update(self):
+        """ Takes a new snapshot if filters, budget or currency information changed since the last one """
+        with cm.compile_lock:
+            key = (fm.version, cm.version, fm.budget)
+            if key == self.key:
+                return self.ref
+
+            index = fm.filterIndex
+            c_budget = cm.compilePrice(fm.budget) if fm.budget else None
+            data = pickle.dumps((index, c_budget, cm.toCCM()), pickle.HIGHEST_PROTOCOL)
+
+        self.key = key
+        self.filters = index.filters
+        if data == self.data:
+            return self.ref
+
+        self.version += 1
+        self.data = data
+        self._close_segment()
+
+        if shared_memory is None:
+            self.ref = SnapshotRef(self.version, data=data)
+        else:
+            # snapshots only change between pages, no worker can be using the previous one
+            self.seg = shared_memory.SharedMemory(create=True, size=len(data))
+            self.seg.buf[:len(data)] = data
+            self.ref = SnapshotRef(self.version, self.seg.name, len(data))
+
+        return self.ref
+
+    def _close_segment(self):
+        if self.seg is not None:
+            self.seg.close()
+            self.seg.unlink()
+            self.seg = None
+
+    def close(self):
+        self._close_segment()
+
+
+def load_snapshot(ref):
+    """
+    Loads a snapshot in a worker process, unless it is already loaded
+    :return: filter index, c_budget
+    """
+    global _loaded
+
+    if _loaded is None or _loaded[0] != ref.version:
+        if ref.name is None:
+            data = ref.data
+        else:
+            seg = shared_memory.SharedMemory(name=ref.name)
+            try:
+                data = bytes(seg.buf[:ref.size])
+            finally:
+                seg.close()
+
+        index, c_budget, ccm = pickle.loads(data)
+        cm.fromCCM(ccm)
+        _loaded = (ref.version, index, c_budget)
+
+    return _loaded[1], _loaded[2]
@@ -0,0 +1,102 @@
+import time
+from collections import deque
+from threading import Condition
+
+
+class FlowControl:
+    """
+    Hands downloaded pages from the downloader to the parser and bounds the memory they hold.
+    The buffer of a sent request is in flight, by its capacity, until the request is released after parsing or dropped.
+    Once the budget is exhausted the downloader stops sending requests, downloads already running complete.
+    """
+
+    def __init__(self, budget):
+        """ :param budget: bytes in flight at which new downloads are paused """
+        self.budget = budget
+        self.in_flight = 0
+        self.pages = deque()
+        self.closed = False
+        self.cond = Condition()
+
+        self.paused = False
+        self.pause_start = None
+        self.pause_time = 0
+        self.pauses = 0
+
+    def add(self, nbytes):
+        """ Records downloaded bytes """
+        with self.cond:
+            self.in_flight += nbytes
+
+    def release(self, nbytes):
+        """ Records bytes which are no longer held """
+        with self.cond:
+            self.in_flight = max(self.in_flight - nbytes, 0)
+
+    def has_room(self):
+        """ :return: whether a new download can start, there is always room for one if nothing is in flight """
+        with self.cond:
+            room = self.in_flight < self.budget or not self.in_flight
+
+            if room and self.paused:
+                self.paused = False
+                self.pause_time += time.time() - self.pause_start
+            elif not room and not self.paused:
+                self.paused = True
+                self.pause_start = time.time()
+                self.pauses += 1
+
+            return room
+
+    def put(self, req):
+        """ Hands a request over to the consumer """
+        with self.cond:
+            if not self.closed:
+                self.pages.append(req)
+                self.cond.notify()
+                return
+
+        # no one will consume it
+        req.release()
+
+    def get(self, timeout=None):
+        """
+        Waits for a request handed over by the downloader
+        :return: request, None if the timeout expired or flow control was closed
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.pages or self.closed, timeout)
+            if self.closed or not self.pages:
+                return None
+            return self.pages.popleft()
+
+    def clear(self):
+        """ Drops requests which were not handed over yet """
+        with self.cond:
+            pages = list(self.pages)
+            self.pages.clear()
+
+        for req in pages:
+            req.release()
+
+    def close(self):
+        """ Wakes up and stops consumers """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def get_stats(self):
+        stats = {}
+
+        with self.cond:
+            pause_time = self.pause_time
+            if self.paused:
+                pause_time += time.time() - self.pause_start
+
+            stats['flow-pages'] = len(self.pages)
+            stats['flow-bytes'] = self.in_flight
+            stats['flow-budget-use'] = self.in_flight / self.budget if self.budget else 0
+            stats['flow-pauses'] = self.pauses
+            stats['flow-pause-time'] = pause_time
+
+        return stats
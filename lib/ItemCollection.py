@@ -9,6 +9,7 @@ class ItemCollection:
 
     base_types = {}
     base_type_to_id = {}
+    bases_by_class = {}  # base types by class flag, classes combinations are added when first requested
     SIX_LINK_EXCEPTIONS = ('The Goddess Unleashed Eternal Sword', 'Tabula Rasa Simple Robe', 'Skin of the Loyal Simple Robe', 'Skin of the Lords Simple Robe')
 
     @classmethod
@@ -19,12 +20,22 @@ class ItemCollection:
 
             cls.base_types = data
             cls.base_type_to_id = {base_type: class_id for class_id in data for base_type in data[class_id]}
+            cls.bases_by_class = {}
+            for iclass in ItemClass:
+                cls._get_bases(iclass)
         except Exception as e:
             raise AppException('Failed loading item base types.\n{}\n'
                                'Make sure the file are valid and in place.'.format(e))
 
     @classmethod
     def get_base_types_by_class(cls, item_class):
-        classes = {iclass.name for iclass in ItemClass if item_class & iclass == iclass}
-        bases = [cls.base_types.get(iclass, []) for iclass in classes]
-        return list(chain.from_iterable(bases))
+        return list(cls._get_bases(item_class))
+
+    @classmethod
+    def _get_bases(cls, item_class):
+        bases = cls.bases_by_class.get(item_class)
+        if bases is None:
+            classes = [iclass.name for iclass in ItemClass if item_class & iclass == iclass]
+            bases = cls.bases_by_class[item_class] = \
+                tuple(chain.from_iterable(cls.base_types.get(iclass, []) for iclass in classes))
+        return bases
@@ -1,6 +1,7 @@
 import copy
 import json
 import re
+import sys
 from datetime import datetime
 from enum import IntEnum
 from json import JSONEncoder
@@ -11,6 +12,7 @@ from lib.CurrencyManager import cm
 from lib.ItemClass import ItemClass
 from lib.ModFilter import ModFilter, ModFilterType
 from lib.ModFilterGroup import FilterGroupFactory, FilterGroupType, ModFilterGroup
+from lib.ModTemplate import get_expr_templates
 from lib.Utility import AppException, get_verror_msg, RE_COMPILED_TYPE
 
 _ITEM_TYPE = {0: 'normal',
@@ -42,6 +44,9 @@ class Filter:
     FILTER_INVALID_PRICE_BASE = "Invalid price in filter: {}. Expected filter to have a base"
     FILTER_INVALID_REGEX = "Invalid regex: '{}' in filter {}. Error while compiling: {}"
 
+    # compiled mod filter fields by memo key, see _compileModFilter
+    _mod_exprs = {}
+
     _FILTER_PRICE_REGEX = re.compile('\s*([+\-*/]?)\s*(.+)')
     _NUMBER_REGEX = re.compile('[0-9]+(?:\.[0-9]+)?$')
 
@@ -132,14 +137,28 @@ class Filter:
 
                 for fg in fgs:
                     for mf in fg.mfs:
-                        if mf.type != ModFilterType.Pseudo:
-                            mf.expr = re.compile(mf.expr)
+                        Filter._compileModFilter(mf)
                 comp[key] = fgs
             else:
                 comp[key] = crit[key]
 
         return comp
 
+    @staticmethod
+    def _compileModFilter(mf):
+        """ Mod filters with the same type and expression share compiled expressions and memo keys """
+        pattern = mf.expr.pattern if isinstance(mf.expr, RE_COMPILED_TYPE) else mf.expr
+        key = '{}:{}'.format(mf.type.value, pattern)
+
+        try:
+            mf.key, mf.expr, mf.template = Filter._mod_exprs[key]
+        except KeyError:
+            mf.key = sys.intern(key)
+            if mf.type != ModFilterType.Pseudo:
+                mf.expr = re.compile(pattern)
+                mf.template = get_expr_templates(mf.expr)
+            Filter._mod_exprs[key] = mf.key, mf.expr, mf.template
+
     @property
     def isChild(self):
         return self.baseId and self.baseId.lower() != self.id.lower()
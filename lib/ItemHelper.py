@@ -1,3 +1,4 @@
+import functools
 import itertools
 import re
 from enum import IntEnum, Enum
@@ -8,11 +9,19 @@ from lib.CurrencyManager import cm
 from lib.ItemCollection import ItemCollection
 from lib.Utility import logger, dround
 from lib.ItemClass import ItemClass, dir_to_id
+from lib.ModFilter import ModFilterType
+from lib.ModTemplate import mods_to_templates, get_expr_templates
 
 float_expr = '[0-9]+|[0-9]+\s*\.\s*[0-9]+'
 _BO_PRICE_REGEX = re.compile('.*~(?:b/o|price)({num})(?:[/\\\\]({num}))?([a-z\-]+)'.format(num=float_expr))
 
 # _BO_PRICE_REGEX = re.compile('.*~(b/o|price)\s+([0-9]+|[0-9]+\.[0-9]+)\s+([a-z\-]+)')
+
+# price after a '~' marker, get_price matches it at the markers instead of scanning notes with _BO_PRICE_REGEX
+_PRICE_REGEX = re.compile('(?:b/o|price)({num})(?:[/\\\\]({num}))?([a-z\-]+)'.format(num=float_expr))
+# notes and stash names repeat a lot
+_PRICE_CACHE_SIZE = 16384
+
 _LOCALIZATION_REGEX = re.compile("<<.*>>")
 superior_expr = re.compile('^Superior ')
 dir_expr = re.compile(r'.*2DItems[/\\](.*)')
@@ -37,8 +46,20 @@ chaos_res_expr = re.compile('([\-+][0-9]+)% to Chaos Resistance$')
 ele_res_expr = re.compile('([\-+][0-9]+)% to all Elemental Resistances$')
 
 
+@functools.lru_cache(maxsize=_PRICE_CACHE_SIZE)
 def get_price(price):
-    match = _BO_PRICE_REGEX.match(price.lower().replace(' ', ''))
+    """ Parses price notes as _BO_PRICE_REGEX does, matching from the '~' markers instead """
+    if '~' not in price:
+        return None
+
+    price = price.lower().replace(' ', '')
+    # like '.*~', the last marker with a valid price wins and markers after a line break are never reached
+    end = price.find('\n')
+    pos = price.rfind('~', 0, end if end >= 0 else len(price))
+    match = None
+    while match is None and pos >= 0:
+        match = _PRICE_REGEX.match(price, pos + 1)
+        pos = price.rfind('~', 0, pos)
 
     if match:
         num, denom, curr = match.groups()
@@ -50,14 +71,60 @@ def get_price(price):
     return None
 
 
+# bounds the class and base caches, repeated bases are common
+_ITEM_CACHE_SIZE = 4096
+# compiled base type expressions by base type
+_base_regexes = {}
+
+
+@functools.lru_cache(maxsize=_ITEM_CACHE_SIZE)
+def _get_item_class(base, icon_dir):
+    base_line = superior_expr.sub('', base, 1)
+    item_class = ItemClass(0)
+    try:
+        # this will fail for magic items with affixes since we dont strip those
+        item_class = ItemClass[ItemCollection.base_type_to_id[base_line]]
+    except KeyError:
+        match = dir_expr.match(icon_dir)
+        # seems to be accurate for the remaining cases
+        if match:
+            item_dirs = re.split(r'[/\\]', match.group(1))[:-1]
+            for item_dir in item_dirs:
+                class_id = dir_to_id.get(item_dir)
+                if class_id:
+                    item_class = ItemClass[class_id]
+                    break
+        # not all flasks have a traditional link
+        elif 'Flask' in base_line:
+            item_class = ItemClass.Flask
+
+    return item_class
+
+
+@functools.lru_cache(maxsize=_ITEM_CACHE_SIZE)
+def _get_item_base(item_class, typeLine):
+    for base in ItemCollection.get_base_types_by_class(item_class):
+        if _get_base_regex(base).search(typeLine):
+            return base
+    return None
+
+
+def _get_base_regex(base):
+    try:
+        return _base_regexes[base]
+    except KeyError:
+        regex = _base_regexes[base] = re.compile(r'\b{}\b'.format(base))
+        return regex
+
+
 class Item:
-    __slots__ = ('_item', 'c_name', 'c_base', 'ilvl', 'links_count', 'corrupted', 'mirrored', 'identified', 'stacksize',
-                 'implicit', 'explicit', 'enchant', 'craft', '_mods', 'sockets_count', 'buyout', 'type',
-                 'crafted', 'enchanted', 'modcount',
+    __slots__ = ('_item', '_c_name', '_c_base', 'ilvl', '_links_count', 'corrupted', 'mirrored', 'identified',
+                 'stacksize', '_implicit', '_explicit', '_enchant', '_craft', '_mods', '_sockets_count', 'type',
+                 '_modcount',
                  '_quality', '_level', '_exp', '_tier',
 
                  'price',  # price before conversion
-                 'c_price',
+                 'c_price', 'buyout',
                  '_iclass', 'rarity',
 
                  '_armour', '_evasion', '_es', '_life',
@@ -65,21 +132,20 @@ class Item:
                  '_aps', '_crit', '_block',
                  '_dps', '_pdps', '_edps',
                  '_formatted_properties',
-                 '_strength_bonus', '_dex_bonus', '_int_bonus', '_attributes_bonus')
+                 '_strength_bonus', '_dex_bonus', '_int_bonus', '_attributes_bonus',
+                 'mod_templates', 'mod_vals', 'pseudo_totals',
+                 'name_matcher', '_name_matches')
 
     def __init__(self, item, stash_price):
         self._item = item
 
-        self.links_count = self._get_item_links_count()
-        self.sockets_count = len(self.sockets)
+        # only fields used by fast checks and plain lookups are set up front,
+        # the rest are computed when a filter needs them
         self.ilvl = item['ilvl']
         self.corrupted = item['corrupted']
         self.mirrored = item.get('duplicated', False)
         self.identified = item['identified']
 
-        self.c_base = self.base.lower()
-        self.c_name = '{} {}'.format(self._get_name().lower(), self.c_base).strip()
-
         # self.type = _ITEM_TYPE[item['frameType']]
         self.type = item['frameType']
         self.rarity = self.get_rarity()
@@ -89,15 +155,17 @@ class Item:
         self.c_price = cm.convert(*self.price) if self.price is not None else None
         self.buyout = self.c_price is not None and self.c_price > 0
 
-        self.implicit = self._item.get('implicitMods', [])
-        self.explicit = self._item.get('explicitMods', [])
-        self.enchant = self._item.get('enchantMods', [])
-        self.craft = self._item.get('craftedMods', [])
-        self._mods = None
+        self._c_name = None
+        self._c_base = None
+        self._links_count = None
+        self._sockets_count = None
 
-        self.crafted = len(self.craft) > 0
-        self.enchanted = len(self.enchant) > 0
-        self.modcount = len(self.implicit) + len(self.explicit) + len(self.enchant) + len(self.craft)
+        self._implicit = None
+        self._explicit = None
+        self._enchant = None
+        self._craft = None
+        self._mods = None
+        self._modcount = None
 
         # Properties and on-demand computed fields
         self._iclass = None
@@ -131,6 +199,73 @@ class Item:
         self._ele_res = None
 
         self._formatted_properties = None
+        self.mod_templates = {}  # mod templates by mod filter type, see mods_to_templates
+        self.mod_vals = None  # mod filter values memo, see get_mod_val
+        self.pseudo_totals = None  # totals of pseudo mod components, see get_pseudo_totals
+        self.name_matcher = None  # set by the filter index when filters have many name fragments
+        self._name_matches = None
+
+    @property
+    def c_base(self):
+        if self._c_base is None:
+            self._c_base = self.base.lower()
+        return self._c_base
+
+    @property
+    def c_name(self):
+        if self._c_name is None:
+            self._c_name = '{} {}'.format(self._get_name().lower(), self.c_base).strip()
+        return self._c_name
+
+    @property
+    def links_count(self):
+        if self._links_count is None:
+            self._links_count = self._get_item_links_count()
+        return self._links_count
+
+    @property
+    def sockets_count(self):
+        if self._sockets_count is None:
+            self._sockets_count = len(self.sockets)
+        return self._sockets_count
+
+    @property
+    def implicit(self):
+        if self._implicit is None:
+            self._implicit = self._item.get('implicitMods', [])
+        return self._implicit
+
+    @property
+    def explicit(self):
+        if self._explicit is None:
+            self._explicit = self._item.get('explicitMods', [])
+        return self._explicit
+
+    @property
+    def enchant(self):
+        if self._enchant is None:
+            self._enchant = self._item.get('enchantMods', [])
+        return self._enchant
+
+    @property
+    def craft(self):
+        if self._craft is None:
+            self._craft = self._item.get('craftedMods', [])
+        return self._craft
+
+    @property
+    def crafted(self):
+        return len(self.craft) > 0
+
+    @property
+    def enchanted(self):
+        return len(self.enchant) > 0
+
+    @property
+    def modcount(self):
+        if self._modcount is None:
+            self._modcount = len(self.implicit) + len(self.explicit) + len(self.enchant) + len(self.craft)
+        return self._modcount
 
     @property
     def mods(self):
@@ -138,6 +273,13 @@ class Item:
             self._mods = list(itertools.chain(self.explicit, self.implicit, self.enchant, self.craft))
         return self._mods
 
+    @property
+    def name_matches(self):
+        """ Name fragments of the active filters contained in the item name, None without a name matcher """
+        if self._name_matches is None and self.name_matcher is not None:
+            self._name_matches = self.name_matcher.find(self.c_name)
+        return self._name_matches
+
     @property
     def modifiable(self):
         return not (self.corrupted or self.mirrored)
@@ -262,61 +404,61 @@ class Item:
     @property
     def fres(self):
         if self._fres is None:
-            self._fres = Item.get_mod_total(fire_res_expr, self.mods)
+            self._fres = self.get_mods_total(fire_res_expr)
         return self._fres
 
     @property
     def cres(self):
         if self._cres is None:
-            self._cres = Item.get_mod_total(cold_res_expr, self.mods)
+            self._cres = self.get_mods_total(cold_res_expr)
         return self._cres
 
     @property
     def lres(self):
         if self._lres is None:
-            self._lres = Item.get_mod_total(lightning_res_expr, self.mods)
+            self._lres = self.get_mods_total(lightning_res_expr)
         return self._lres
 
     @property
     def chres(self):
         if self._chres is None:
-            self._chres = Item.get_mod_total(chaos_res_expr, self.mods)
+            self._chres = self.get_mods_total(chaos_res_expr)
         return self._chres
 
     @property
     def ele_res(self):
         if self._ele_res is None:
-            self._ele_res = Item.get_mod_total(ele_res_expr, self.mods)
+            self._ele_res = self.get_mods_total(ele_res_expr)
         return self._ele_res
 
     @property
     def strength_bonus(self):
         if self._strength_bonus is None:
-            self._strength_bonus = Item.get_mod_total(strength_expr, self.mods)
+            self._strength_bonus = self.get_mods_total(strength_expr)
         return self._strength_bonus
 
     @property
     def dex_bonus(self):
         if self._dex_bonus is None:
-            self._dex_bonus = Item.get_mod_total(dex_expr, self.mods)
+            self._dex_bonus = self.get_mods_total(dex_expr)
         return self._dex_bonus
 
     @property
     def int_bonus(self):
         if self._int_bonus is None:
-            self._int_bonus = Item.get_mod_total(int_expr, self.mods)
+            self._int_bonus = self.get_mods_total(int_expr)
         return self._int_bonus
 
     @property
     def attributes_bonus(self):
         if self._attributes_bonus is None:
-            self._attributes_bonus = Item.get_mod_total(attributes_expr, self.mods)
+            self._attributes_bonus = self.get_mods_total(attributes_expr)
         return self._attributes_bonus
 
     @property
     def life(self):
         if self._life is None:
-            self._life = Item.get_mod_total(life_expr, self.mods)
+            self._life = self.get_mods_total(life_expr)
         return self._life
 
     @property
@@ -428,6 +570,38 @@ class Item:
 
 
 
+    def get_mods_total(self, expr):
+        """ get_mod_total of all item mods, by template lookup when the expression supports it """
+        expr_templates = get_expr_templates(expr)
+        if expr_templates is None:
+            return Item.get_mod_total(expr, self.mods)
+
+        mod_templates = self.mod_templates.get(ModFilterType.Total)
+        if mod_templates is None:
+            mod_templates = self.mod_templates[ModFilterType.Total] = mods_to_templates(self.mods)
+        return Item.get_template_total(expr_templates, mod_templates)
+
+    @staticmethod
+    def get_template_total(expr_templates, mod_templates, skip_vals=False):
+        """ Equivalent of get_mod_total, using expression templates and mod templates instead """
+        total = 0
+        mults = None
+
+        for template, template_mults in expr_templates.items():
+            vals_list = mod_templates.get(template)
+            if vals_list is not None:
+                if skip_vals or not template_mults:
+                    return 1
+
+                mults = template_mults
+                for vals in vals_list:
+                    for mult, val in zip(mults, vals):
+                        total += mult * float(val)
+
+        if mults is None:
+            return 0
+        return total / len(mults)
+
     @staticmethod
     def get_mod_total(expr, mods, skip_vals=False):
         total = 0
@@ -512,38 +686,20 @@ class Item:
         return evasion * (120 + total) / (quality + 100 + total)
 
     def get_item_class(self):
-        global superior_expr
-        base_line = superior_expr.sub('', self.base, 1)
-        item_class = ItemClass(0)
-        try:
-            # this will fail for magic items with affixes since we dont strip those
-            item_class = ItemClass[ItemCollection.base_type_to_id[base_line]]
-        except KeyError:
-            match = dir_expr.match(self.icon)
-            # seems to be accurate for the remaining cases
-            if match:
-                item_dirs = re.split(r'[/\\]', match.group(1))[:-1]
-                for item_dir in item_dirs:
-                    class_id = dir_to_id.get(item_dir)
-                    if class_id:
-                        item_class = ItemClass[class_id]
-                        break
-            # not all flasks have a traditional link
-            elif 'Flask' in base_line:
-                item_class = ItemClass.Flask
+        # the class only depends on the base and the icon directories
+        icon = self.icon.split('?', 1)[0]
+        icon_dir = icon[:max(icon.rfind('/'), icon.rfind('\\')) + 1]
+        item_class = _get_item_class(self.base, icon_dir)
 
         if not item_class:
+            base_line = superior_expr.sub('', self.base, 1)
             logger.warn('Failed determining item class. item: {}, base_line: {}, link {}'.format(self.name, base_line, self.icon))
 
         return item_class
 
     def get_item_base(self):
         if self.iclass:
-            bases = ItemCollection.get_base_types_by_class(self.iclass)
-            typeLine = self._item['typeLine']
-            for base in bases:
-                if re.search(r'\b{}\b'.format(base), typeLine):
-                    return base
+            return _get_item_base(self.iclass, self._item['typeLine'])
         return None
 
     def get_max_sockets(self):
@@ -31,13 +31,15 @@ class ModFilterType(Enum):
 # _typeToName = dict(reversed(item) for item in _nameToType.items())
 
 class ModFilter:
-    __slots__ = ['type', 'expr', 'min', 'max']
+    __slots__ = ['type', 'expr', 'min', 'max', 'template', 'key']
 
     def __init__(self, mod_type=ModFilterType.Total, expr='', min_val=None, max_val=None):
         self.type = mod_type
         self.expr = expr
         self.min = float(min_val) if min_val is not None else min_val
         self.max = float(max_val) if max_val is not None else max_val
+        self.template = None  # mod templates of a compiled expression, see expr_to_templates
+        self.key = None  # item mod values memo key of a compiled filter, shared by equal filters
 
     @classmethod
     def fromData(cls, data):
@@ -2,8 +2,10 @@ import re
 from abc import ABCMeta, abstractmethod
 from enum import Enum
 
-from lib.ItemHelper import Item
+from lib.ItemHelper import Item, fire_res_expr, cold_res_expr, lightning_res_expr, chaos_res_expr, ele_res_expr, \
+    strength_expr, dex_expr, int_expr, attributes_expr, life_expr
 from lib.ModFilter import ModFilter, ModFilterType
+from lib.ModTemplate import get_expr_templates, mods_to_templates, get_mod_template, TEMPLATE_NUM, MAX_CACHED_MODS
 
 
 class ModFilterGroup(metaclass=ABCMeta):
@@ -138,63 +140,123 @@ def checkmods_count(item, mfs, match_min, match_max):
     return match_min <= matched <= match_max
 
 def get_mod_val(item, mf, skip_vals=False):
-    expr = mf.expr
-    mod_val = 0
+    """ Memoized compute_mod_val, filters with the same mod filter type and expression share values per item """
+    if mf.key is None:
+        return compute_mod_val(item, mf, skip_vals)
 
+    if item.mod_vals is None:
+        item.mod_vals = ({}, {})
+
+    mod_vals = item.mod_vals[skip_vals]
+    try:
+        return mod_vals[mf.key]
+    except KeyError:
+        mod_val = mod_vals[mf.key] = compute_mod_val(item, mf, skip_vals)
+        return mod_val
+
+def compute_mod_val(item, mf, skip_vals=False):
     if mf.type == ModFilterType.Pseudo:
-        if expr not in PSEUDO_MODS:
+        pseudo_id = PSEUDO_IDS.get(mf.expr)
+        if pseudo_id is None:
             return 0
-
-        mod_exprs = COMPILED_PSEUDO_MODS[expr]
-        if mod_exprs:
-            for mod_expr in mod_exprs:
-                mod_val += Item.get_mod_total(mod_expr, item.mods, skip_vals)
-
-                if mod_val and skip_vals:
-                    break
-        elif expr == '# Elemental Resistances':
-            if item.ele_res:
-                mod_val = 3
+        return get_pseudo_val(item, pseudo_id, skip_vals)
+
+    return get_mods_total(item, mf.type, mf.expr, mf.template, skip_vals)
+
+def get_pseudo_val(item, pseudo_id, skip_vals=False):
+    """ Value of a pseudo mod, derived from the component totals of the item """
+    totals = item.pseudo_totals
+    if totals is None:
+        totals = item.pseudo_totals = get_pseudo_totals(item)
+
+    components, formula = _PSEUDO_TABLE[pseudo_id]
+    if formula is not None:
+        return formula(*[totals[comp] or 0 for comp in components])
+
+    # sum of mod totals, any matching mod will do when values are skipped
+    if skip_vals:
+        return 1 if any(totals[comp] is not None for comp in components) else 0
+    return sum(totals[comp] or 0 for comp in components)
+
+def get_pseudo_totals(item):
+    """
+    Totals of every pseudo mod component in a single pass over the item mods, None for components no mod matched
+    :return: list of totals by component id
+    """
+    sums = [None] * len(_COMPONENTS)
+    for mod in item.mods:
+        template, vals = get_mod_template(mod)
+        for comp, groups in _get_template_dispatch(template):
+            if groups is None:
+                # component resolved by its expression for every mod line of this template
+                match = _COMPONENTS[comp][1].match(mod)
+                if not match:
+                    continue
+                total = sum(float(val) for val in match.groups())
             else:
-                mod_val += 1 if item.cres else 0
-                mod_val += 1 if item.fres else 0
-                mod_val += 1 if item.lres else 0
-        elif expr == '# Resistances':
-            if item.ele_res:
-                mod_val = 3
-            else:
-                mod_val += 1 if item.cres else 0
-                mod_val += 1 if item.fres else 0
-                mod_val += 1 if item.lres else 0
-            mod_val += 1 if item.chres else 0
-        elif expr == '+#% total Elemental Resistance':
-            mod_val = item.ele_res * 3 + item.cres + item.fres + item.lres
-        elif expr == '+#% total Resistance':
-            mod_val = item.ele_res * 3 + item.cres + item.fres + item.lres + item.chres
-        elif expr == '(total) +#% to all Elemental Resistances':
-            mod_val = item.ele_res + min(item.cres, item.fres, item.lres)
-        elif expr == '(total) +#% to Cold Resistance':
-            mod_val = item.cres
-        elif expr == '(total) +#% to Fire Resistance':
-            mod_val = item.fres
-        elif expr == '(total) +#% to Lightning Resistance':
-            mod_val = item.lres
-        elif expr == '(total) +# to all Attributes':
-            mod_val = item.attributes_bonus + min(item.strength_bonus, item.dex_bonus, item.int_bonus)
-        elif expr == '(total) +# to Strength':
-            mod_val = item.attributes_bonus + item.strength_bonus
-        elif expr == '(total) +# to Dexterity':
-            mod_val = item.attributes_bonus + item.dex_bonus
-        elif expr == '(total) +# to Intelligence':
-            mod_val = item.attributes_bonus + item.int_bonus
-        elif expr == '(total) +# to maximum Life':
-            mod_val = item.life + (item.strength_bonus + item.attributes_bonus) / 2
-
-    else:
-        mods_list = get_mods_by_type(item, mf.type)
-        mod_val = Item.get_mod_total(expr, mods_list, skip_vals)
-
-    return mod_val
+                total = 0
+                for k, mult in groups:
+                    total += mult * float(vals[k])
+
+            sums[comp] = total if sums[comp] is None else sums[comp] + total
+
+    return [None if total is None else total / _COMPONENTS[comp][1].groups for comp, total in enumerate(sums)]
+
+def _get_template_dispatch(template):
+    """ Cached _resolve_template """
+    try:
+        return _template_dispatch[template]
+    except KeyError:
+        if len(_template_dispatch) >= MAX_CACHED_MODS:
+            _template_dispatch.clear()
+        dispatch = _template_dispatch[template] = _resolve_template(template)
+        return dispatch
+
+def _resolve_template(template):
+    """
+    :return: tuple of (component id, groups) of every component matching mod lines of a template.
+    groups are (number index, multiplier) of every expression group, None when the expression has to be matched
+    against the mod line itself
+    """
+    dispatch = []
+
+    # mod lines with a placeholder have no template, only expressions can match them
+    line = template.replace(TEMPLATE_NUM, '1') if template is not None else None
+    numbers = [i for i, c in enumerate(template) if c == TEMPLATE_NUM] if template is not None else ()
+
+    for comp, (key, expr, expr_templates) in enumerate(_COMPONENTS):
+        if expr_templates is not None:
+            mults = expr_templates.get(template)
+            if mults is not None:
+                dispatch.append((comp, tuple(enumerate(mults))))
+        elif line is None:
+            dispatch.append((comp, None))
+        else:
+            # expressions treat every number alike, matching the template with ones locates the numbers of each group
+            match = expr.match(line)
+            if match:
+                groups = []
+                for start, end in match.regs[1:]:
+                    if start in numbers and end == start + 1:
+                        groups.append((numbers.index(start), 1))
+                    elif start + 1 in numbers and end == start + 2 and line[start] in '+-':
+                        groups.append((numbers.index(start + 1), -1 if line[start] == '-' else 1))
+                    else:
+                        groups = None
+                        break
+                dispatch.append((comp, tuple(groups) if groups is not None else None))
+
+    return tuple(dispatch)
+
+def get_mods_total(item, mf_type, expr, templates, skip_vals=False):
+    """ Mod total of an expression, looked up by mod templates if the expression has them """
+    if templates is None:
+        return Item.get_mod_total(expr, get_mods_by_type(item, mf_type), skip_vals)
+
+    mod_templates = item.mod_templates.get(mf_type)
+    if mod_templates is None:
+        mod_templates = item.mod_templates[mf_type] = mods_to_templates(get_mods_by_type(item, mf_type))
+    return Item.get_template_total(templates, mod_templates, skip_vals)
 
 def get_mods_by_type(item, mf_type):
     if mf_type == ModFilterType.Total:
@@ -276,4 +338,86 @@ PSEUDO_MODS = {
     '(total) Adds # Physical Damage to Attacks': ('Adds ([0-9]+) to ([0-9]+) Physical Damage(?: to Attacks)?$', ),
 }
 
-COMPILED_PSEUDO_MODS = {k: [re.compile(mod) for mod in PSEUDO_MODS[k]] if PSEUDO_MODS[k] else None for k in PSEUDO_MODS}
+# item stats pseudo mods are derived from, as computed by the item properties of the same name
+_STAT_EXPRS = {
+    'fres': fire_res_expr,
+    'cres': cold_res_expr,
+    'lres': lightning_res_expr,
+    'chres': chaos_res_expr,
+    'ele_res': ele_res_expr,
+    'strength_bonus': strength_expr,
+    'dex_bonus': dex_expr,
+    'int_bonus': int_expr,
+    'attributes_bonus': attributes_expr,
+    'life': life_expr,
+}
+
+def _count_ele_res(ele_res, cres, fres, lres):
+    if ele_res:
+        return 3
+    return (1 if cres else 0) + (1 if fres else 0) + (1 if lres else 0)
+
+# pseudo mods derived from item stats: (stats, function of the stat totals)
+_PSEUDO_FORMULAS = {
+    '# Elemental Resistances': (
+        ('ele_res', 'cres', 'fres', 'lres'), _count_ele_res),
+    '# Resistances': (
+        ('ele_res', 'cres', 'fres', 'lres', 'chres'),
+        lambda ele_res, cres, fres, lres, chres: _count_ele_res(ele_res, cres, fres, lres) + (1 if chres else 0)),
+    '+#% total Elemental Resistance': (
+        ('ele_res', 'cres', 'fres', 'lres'),
+        lambda ele_res, cres, fres, lres: ele_res * 3 + cres + fres + lres),
+    '+#% total Resistance': (
+        ('ele_res', 'cres', 'fres', 'lres', 'chres'),
+        lambda ele_res, cres, fres, lres, chres: ele_res * 3 + cres + fres + lres + chres),
+    '(total) +#% to all Elemental Resistances': (
+        ('ele_res', 'cres', 'fres', 'lres'),
+        lambda ele_res, cres, fres, lres: ele_res + min(cres, fres, lres)),
+    '(total) +#% to Cold Resistance': (('cres', ), lambda cres: cres),
+    '(total) +#% to Fire Resistance': (('fres', ), lambda fres: fres),
+    '(total) +#% to Lightning Resistance': (('lres', ), lambda lres: lres),
+    '(total) +# to all Attributes': (
+        ('attributes_bonus', 'strength_bonus', 'dex_bonus', 'int_bonus'),
+        lambda attributes, strength, dex, intelligence: attributes + min(strength, dex, intelligence)),
+    '(total) +# to Strength': (
+        ('attributes_bonus', 'strength_bonus'), lambda attributes, strength: attributes + strength),
+    '(total) +# to Dexterity': (
+        ('attributes_bonus', 'dex_bonus'), lambda attributes, dex: attributes + dex),
+    '(total) +# to Intelligence': (
+        ('attributes_bonus', 'int_bonus'), lambda attributes, intelligence: attributes + intelligence),
+    '(total) +# to maximum Life': (
+        ('life', 'strength_bonus', 'attributes_bonus'),
+        lambda life, strength, attributes: life + (strength + attributes) / 2),
+}
+
+def _build_pseudo_table():
+    """
+    :return: components, pseudo mod ids, pseudo mod table.
+    components are (key, expression, expression templates) of item stats and pseudo mod expressions,
+    the table is (component ids, formula) by pseudo mod id, formula is None for sums of mod totals
+    """
+    components = []
+    component_ids = {}
+
+    def get_component(key, expr):
+        if key not in component_ids:
+            component_ids[key] = len(components)
+            components.append((key, expr, get_expr_templates(expr)))
+        return component_ids[key]
+
+    pseudo_ids = {}
+    table = []
+    for pseudo_mod, mod_exprs in PSEUDO_MODS.items():
+        pseudo_ids[pseudo_mod] = len(table)
+        if mod_exprs:
+            table.append((tuple(get_component(mod, re.compile(mod)) for mod in mod_exprs), None))
+        else:
+            stats, formula = _PSEUDO_FORMULAS[pseudo_mod]
+            table.append((tuple(get_component(stat, _STAT_EXPRS[stat]) for stat in stats), formula))
+
+    return components, pseudo_ids, table
+
+_COMPONENTS, PSEUDO_IDS, _PSEUDO_TABLE = _build_pseudo_table()
+
+# components matching mod lines, by template
+_template_dispatch = {}
@@ -0,0 +1,171 @@
+import re
+
+# mod lines are normalized to templates by replacing every number with this placeholder
+TEMPLATE_NUM = '#'
+MAX_TEMPLATES = 64
+MAX_CACHED_MODS = 50000
+
+_NUM_SPLIT_REGEX = re.compile('([0-9]+)')
+
+_NUM_GROUP = '([0-9]+)'
+_SIGNED_GROUPS = ('([\\-+][0-9]+)', '([+\\-][0-9]+)', '([-+][0-9]+)', '([+-][0-9]+)')
+_SPECIAL_CHARS = '.^$*+?{}[]()|\\'
+
+# templates of mod lines, mod lines repeat a lot across items
+_mod_templates = {}
+# templates by expression pattern
+_expr_templates = {}
+
+
+class _UnsupportedPattern(Exception):
+    pass
+
+
+def mod_to_template(mod):
+    """
+    Normalizes a mod line, e.g. '+57 to maximum Life' to ('+# to maximum Life', ('57', ))
+    :return: template, number strings in order of appearance. template is None if the line contains a placeholder
+    """
+    if TEMPLATE_NUM in mod:
+        # no supported expression can match a literal placeholder
+        return None, ()
+
+    parts = _NUM_SPLIT_REGEX.split(mod)
+    template = TEMPLATE_NUM.join(parts[0::2])
+    # '$' also matches right before a trailing newline
+    if template.endswith('\n'):
+        template = template[:-1]
+    return template, tuple(parts[1::2])
+
+
+def get_mod_template(mod):
+    """ Cached mod_to_template """
+    try:
+        return _mod_templates[mod]
+    except KeyError:
+        if len(_mod_templates) >= MAX_CACHED_MODS:
+            _mod_templates.clear()
+        template = _mod_templates[mod] = mod_to_template(mod)
+        return template
+
+
+def mods_to_templates(mods):
+    """ :return: dict of template to number strings of every mod line with that template """
+    templates = {}
+    for mod in mods:
+        template, vals = get_mod_template(mod)
+        try:
+            templates[template].append(vals)
+        except KeyError:
+            templates[template] = [vals]
+    return templates
+
+
+def expr_to_templates(pattern):
+    """
+    Expands a mod expression to every mod template it matches.
+    Only a restricted syntax is supported: literals, escaped characters, number groups '([0-9]+)',
+    signed number groups '([\\-+][0-9]+)', non-capturing alternations '(?:a|b)', optional characters or
+    alternations and a trailing '$', which is required.
+    :return: dict of template to value multipliers of every group, None if the pattern is not supported
+    """
+    if not pattern.endswith('$') or _is_escaped(pattern, len(pattern) - 1):
+        return None
+
+    try:
+        variants, i = _parse_seq(pattern[:-1], 0)
+        if i != len(pattern) - 1:
+            return None
+    except _UnsupportedPattern:
+        return None
+
+    return dict(variants)
+
+
+def get_expr_templates(expr):
+    """ Cached expr_to_templates of a compiled expression, None for expressions compiled with flags """
+    if expr.flags != re.UNICODE:
+        return None
+
+    try:
+        return _expr_templates[expr.pattern]
+    except KeyError:
+        templates = _expr_templates[expr.pattern] = expr_to_templates(expr.pattern)
+        return templates
+
+
+def _is_escaped(pattern, i):
+    count = 0
+    while i > 0 and pattern[i - 1] == '\\':
+        count += 1
+        i -= 1
+    return count % 2 == 1
+
+
+def _parse_seq(pattern, i):
+    variants = [('', ())]
+
+    while i < len(pattern):
+        c = pattern[i]
+        if c in '|)':
+            break
+
+        if pattern.startswith(_NUM_GROUP, i):
+            units = [(TEMPLATE_NUM, (1, ))]
+            i += len(_NUM_GROUP)
+        elif pattern.startswith(_SIGNED_GROUPS, i):
+            units = [('+' + TEMPLATE_NUM, (1, )), ('-' + TEMPLATE_NUM, (-1, ))]
+            i += len(next(grp for grp in _SIGNED_GROUPS if pattern.startswith(grp, i)))
+        elif pattern.startswith('(?:', i):
+            units, i = _parse_alt(pattern, i + 3)
+        elif c == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                raise _UnsupportedPattern()
+            units = [_literal(pattern[i + 1])]
+            i += 2
+        elif c in _SPECIAL_CHARS:
+            raise _UnsupportedPattern()
+        else:
+            units = [_literal(c)]
+            i += 1
+
+        if i < len(pattern) and pattern[i] in '*+{':
+            raise _UnsupportedPattern()
+        if i < len(pattern) and pattern[i] == '?':
+            # groups inside optional parts would produce missing values
+            if any(mults for _, mults in units):
+                raise _UnsupportedPattern()
+            units = units + [('', ())]
+            i += 1
+
+        variants = [(text + unit, mults + unit_mults) for text, mults in variants for unit, unit_mults in units]
+        if len(variants) > MAX_TEMPLATES:
+            raise _UnsupportedPattern()
+
+    return variants, i
+
+
+def _parse_alt(pattern, i):
+    units = []
+    while True:
+        variants, i = _parse_seq(pattern, i)
+        units.extend(variants)
+
+        if i >= len(pattern):
+            raise _UnsupportedPattern()
+        if pattern[i] == ')':
+            break
+        i += 1
+
+    # groups inside alternations would produce missing values
+    if any(mults for _, mults in units):
+        raise _UnsupportedPattern()
+
+    return units, i + 1
+
+
+def _literal(c):
+    # mod templates have no digits and placeholders only where numbers are
+    if c.isdigit() or c == TEMPLATE_NUM:
+        raise _UnsupportedPattern()
+    return c, ()
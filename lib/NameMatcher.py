@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class NameMatcher:
+    """
+    Aho-Corasick automaton over name fragments.
+    Finds every fragment contained in a name in a single pass over the name, regardless of the fragment count.
+    """
+
+    def __init__(self, fragments=()):
+        self.goto = [{}]  # state transitions by character
+        self.fail = [0]  # state to fall back to when there is no transition
+        self.out = [()]  # fragments ending at a state
+
+        for fragment in fragments:
+            self._add(fragment)
+        self._link()
+
+    def __len__(self):
+        return len(self.goto)
+
+    def _add(self, fragment):
+        state = 0
+        for ch in fragment:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = self.goto[state][ch] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = next_state
+
+        if fragment not in self.out[state]:
+            self.out[state] += (fragment, )
+
+    def _link(self):
+        goto, fail, out = self.goto, self.fail, self.out
+
+        # breadth first, fallback states are always shallower
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fallback = goto[fallback].get(ch, 0)
+
+                fail[next_state] = fallback
+                out[next_state] += out[fallback]
+
+    def find(self, name):
+        """ :return: set of fragments contained in name """
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+
+        state = 0
+        for ch in name:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+
+        return found
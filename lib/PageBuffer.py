@@ -0,0 +1,178 @@
+import os
+from collections import OrderedDict
+
+try:
+    # Python 3.8+
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+try:
+    # Python 3.8+, imports on Windows as well but only tracks segments on POSIX
+    from multiprocessing import resource_tracker
+except ImportError:
+    resource_tracker = None
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+SEGMENT_ALIGN = 1024 * 1024
+MAX_FREE_SEGMENTS = 8
+MAX_ATTACHED_SEGMENTS = 16
+
+# segments attached by a worker process, by name
+_attached = OrderedDict()
+
+
+class PageSlice:
+    """ Picklable reference to stash objects stored in a shared memory segment """
+    __slots__ = ('name', 'ranges')
+
+    def __init__(self, name, ranges):
+        self.name = name
+        self.ranges = ranges
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __getstate__(self):
+        return self.name, self.ranges
+
+    def __setstate__(self, state):
+        self.name, self.ranges = state
+
+
+def read_stashes(source):
+    """
+    :param source: PageSlice or a list of raw stash objects
+    :return: decoded stash objects as strings
+    """
+    if not isinstance(source, PageSlice):
+        return [chunk.decode() for chunk in source]
+
+    buf = _attach(source.name).buf
+    return [str(buf[begin:end], 'utf-8') for begin, end in source.ranges]
+
+
+def _attach(name):
+    try:
+        _attached.move_to_end(name)
+        return _attached[name]
+    except KeyError:
+        pass
+
+    while len(_attached) >= MAX_ATTACHED_SEGMENTS:
+        _attached.popitem(last=False)[1].close()
+
+    seg = shared_memory.SharedMemory(name=name)
+    _attached[name] = seg
+    return seg
+
+
+class PageBufferPool:
+    """ Recycles shared memory segments used to pass page data to the workers """
+
+    def __init__(self):
+        self.free = []
+        self.segments = []
+
+        # must be running before the workers are started, otherwise each worker starts a tracker of its own
+        # which unlinks the segments it attached to when it exits. Windows frees segments with their last handle
+        if shared_memory is not None and resource_tracker is not None and os.name == 'posix':
+            resource_tracker.ensure_running()
+
+    @property
+    def shared(self):
+        return shared_memory is not None
+
+    def acquire(self):
+        return PageBuffer(self)
+
+    def get_segment(self, size):
+        fits = [seg for seg in self.free if seg.size >= size]
+        if fits:
+            seg = min(fits, key=lambda s: s.size)
+            self.free.remove(seg)
+            return seg
+
+        size = max(SEGMENT_SIZE, -(-size // SEGMENT_ALIGN) * SEGMENT_ALIGN)
+        seg = shared_memory.SharedMemory(create=True, size=size)
+        self.segments.append(seg)
+        return seg
+
+    def put_segment(self, seg):
+        self.free.append(seg)
+        if len(self.free) > MAX_FREE_SEGMENTS:
+            self._destroy(min(self.free, key=lambda s: s.size))
+
+    def _destroy(self, seg):
+        self.free.remove(seg)
+        self.segments.remove(seg)
+        seg.close()
+        seg.unlink()
+
+    def close(self):
+        for seg in self.segments:
+            seg.close()
+            seg.unlink()
+        self.segments = []
+        self.free = []
+
+
+class PageBuffer:
+    """
+    Page data in shared memory, valid until released.
+    Falls back to raw stash objects when shared memory is not supported.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.segments = []
+        self.used = 0
+
+    def store(self, data, groups):
+        """
+        Stores a whole page
+        :param groups: list of (start, end) stash ranges in data, for every worker task
+        :return: a source of stashes to pass to read_stashes, for every group
+        """
+        if not self.pool.shared:
+            return [[bytes(data[begin:end]) for begin, end in group] for group in groups]
+
+        seg = self._segment(len(data))
+        seg.buf[:len(data)] = data
+        self.used = len(data)
+        return [PageSlice(seg.name, group) for group in groups]
+
+    def add(self, chunks):
+        """
+        Appends raw stash objects of a page which is still being received
+        :return: a source of the stashes to pass to read_stashes
+        """
+        if not self.pool.shared:
+            return chunks
+
+        size = sum(len(chunk) for chunk in chunks)
+        if not self.segments or self.used + size > self.segments[-1].size:
+            # earlier segments are kept until the page is released, workers might still be reading them
+            self._segment(size)
+            self.used = 0
+
+        seg = self.segments[-1]
+        ranges = []
+        for chunk in chunks:
+            end = self.used + len(chunk)
+            seg.buf[self.used:end] = chunk
+            ranges.append((self.used, end))
+            self.used = end
+
+        return PageSlice(seg.name, ranges)
+
+    def _segment(self, size):
+        seg = self.pool.get_segment(size)
+        self.segments.append(seg)
+        return seg
+
+    def release(self):
+        for seg in self.segments:
+            self.pool.put_segment(seg)
+        self.segments = []
+        self.used = 0
@@ -1,25 +1,27 @@
-import json
 import logging
 import os
 from collections import deque
 from multiprocessing.pool import Pool
-from queue import Queue, Empty
 from threading import Thread
 
 import time
 
-from lib.CurrencyManager import cm
-from lib.FilterManager import fm
-from lib.StashHelper import parse_next_id, parse_stashes_parallel
+from lib.FilterProfiler import FilterProfile
+from lib.FilterSnapshot import FilterSnapshot
+from lib.PageBuffer import PageBufferPool
+from lib.StashHelper import parse_next_id, parse_stashes_parallel, parse_stash_data, handle_results, handle_stats
 from lib.Utility import msgr, logexception
 
 JSON_ERROR_FNAME = "{}.error.json"
 JSON_ERROR_DIR = "log\\"
+STREAM_POLL_INTERVAL = 0.1
+PROFILE_DUMP_INTERVAL = 300
 
 class ParserThread(Thread):
-    def __init__(self, num_workers, league, stateMgr, resultHandler):
+    def __init__(self, num_workers, league, stateMgr, resultHandler, flow, profile_filters=False, sample_interval=0):
         Thread.__init__(self)
-        self.queue = Queue(maxsize=25)
+        # downloaded requests are taken from flow control, their bytes are released once parsed
+        self.flow = flow
         self.num_workers = num_workers
         self.league = league
         self.stateMgr = stateMgr
@@ -27,15 +29,20 @@ class ParserThread(Thread):
         self._finished = False
         self.signal_stop = False
 
+        self.buffers = PageBufferPool()
+        self.snapshot = FilterSnapshot()
+        # filter statistics reported by the workers, when profiling filters
+        self.profile = FilterProfile() if profile_filters else None
+        self.last_dump = time.time()
+        # filter criteria are sampled on one of every sample_interval items to order filter checks, 0 to disable
+        self.sample_interval = sample_interval
+
         self.parse_times = deque(maxlen=20)
         self.parse_speed = deque(maxlen=20)
 
     def stop(self):
         self._finished = True
-        self.queue.put(None)
-
-    def put(self, request_id, data, timeout=None):
-        self.queue.put((request_id, data), timeout=timeout)
+        self.flow.close()
 
     def run(self):
         # pr = cProfile.Profile()
@@ -48,31 +55,40 @@ class ParserThread(Thread):
 
             msgr.send_msg('Parser started..', logging.INFO)
             while not self._finished:
+                req, data = None, None
                 try:
-                    item = self.queue.get()
-                    if item is None:
+                    req = self.flow.get()
+                    if req is None:
                         break
 
-                    request_id, b = item
+                    request_id = req.req_id
                     msgr.send_update_id(request_id)
 
                     last_parse = time.time()
-                    data = json.loads(b.getvalue().decode())
+                    # streamed requests are parsed as they download
+                    data = None if req.stream else req.buffer.getbuffer()
 
-                    # snapshot filters and currency information
-                    with cm.compile_lock:
-                        filters = fm.getActiveFilters()
-                        c_budget = cm.compilePrice(fm.budget) if fm.budget else None
-                        ccm = cm.toCCM()
+                    # snapshot filters and currency information, workers reload it only when it changes
+                    self.snapshot.update()
 
-                    if not len(filters):
+                    if not len(self.snapshot.filters):
                         msgr.send_msg("No filters are active. Stopping..")
                         self.signal_stop = True
                         break
 
                     # pr.enable()
-                    tabs, league_tabs, items = parse_stashes_parallel(data, filters, ccm, self.league, c_budget,
-                                                            self.stateMgr, self.resultHandler, self.num_workers, pool)
+                    page = self.buffers.acquire()
+                    try:
+                        if req.stream:
+                            tabs, league_tabs, items, last_parse = self.parse_stream(req, pool, page)
+                        else:
+                            tabs, league_tabs, items = parse_stashes_parallel(data, self.snapshot, self.league, self.stateMgr,
+                                                                              self.resultHandler, self.num_workers,
+                                                                              pool, page, self.profile,
+                                                                              self.sample_interval)
+                    finally:
+                        # workers are done with the page once results are in
+                        page.release()
 
                     # pr.disable()
 
@@ -85,6 +101,9 @@ class ParserThread(Thread):
 
                     msgr.send_msg("Parse: {:.3f}s, Tabs: {}, League tabs: {}, Items: {}"
                                   .format(parse_time, tabs, league_tabs, items), logging.DEBUG)
+
+                    if self.profile and time.time() - self.last_dump > PROFILE_DUMP_INTERVAL:
+                        self.dump_profile()
                 # except Empty:
                 #     pass
                 except Exception as e:
@@ -93,10 +112,62 @@ class ParserThread(Thread):
                     logexception()
                     if data:
                         fname = os.path.join(JSON_ERROR_DIR, JSON_ERROR_FNAME.format(request_id))
-                        with open(fname, "w") as f:
-                            json.dump(data, f, indent=4, separators=(',', ': '))
-
-            msgr.send_msg('Parser stopped', logging.INFO)
+                        with open(fname, "wb") as f:
+                            f.write(data)
+                finally:
+                    if req:
+                        req.release()
+
+        self.buffers.close()
+        self.snapshot.close()
+        if self.profile:
+            self.dump_profile()
+        msgr.send_msg('Parser stopped', logging.INFO)
+
+    def parse_stream(self, req, pool, page):
+        """ Sends stashes of a streamed request to the workers as they arrive, handles results in order """
+        pending = deque()
+        n_stashes = 0
+        generation = 0
+        tabs, league_tabs, items = 0, 0, 0
+        start = None
+        finished = False
+
+        try:
+            while not finished or pending:
+                if not finished:
+                    chunks, stash_gen, finished = req.get_stashes(n_stashes, generation, timeout=STREAM_POLL_INTERVAL)
+                    if stash_gen != generation:
+                        # the download was retried, stashes start over and items already handled are deduped by stateMgr
+                        generation = stash_gen
+                        n_stashes = 0
+                    if chunks:
+                        n_stashes += len(chunks)
+                        source = page.add(chunks)
+                        result = pool.apply_async(parse_stash_data, (source, self.league, self.snapshot.ref,
+                                                                     self.profile is not None, self.sample_interval))
+                        pending.append((result, chunks))
+                        if start is None:
+                            start = time.time()
+
+                # once the download is done, there is nothing left to wait for but the workers
+                while pending and (finished or pending[0][0].ready()):
+                    result, chunks = pending.popleft()
+                    results, n_tabs, n_league_tabs, n_items, stats = result.get()
+                    handle_results(results, chunks, self.snapshot.filters, self.stateMgr, self.resultHandler)
+                    handle_stats(stats, self.snapshot.filters, self.profile)
+                    tabs += n_tabs
+                    league_tabs += n_league_tabs
+                    items += n_items
+        finally:
+            # the page buffer is released after this, make sure no worker is still reading it
+            for result, _ in pending:
+                result.wait()
+
+        if not req.cancelled:
+            self.stateMgr.saveState(req.submitted_next)
+
+        return tabs, league_tabs, items, start or time.time()
 
     def get_stats(self):
         stats = {}
@@ -104,4 +175,15 @@ class ParserThread(Thread):
         stats['parse-time'] = sum(self.parse_times) / len(self.parse_times) if len(self.parse_times) else 0
         stats['parse-speed'] = sum(self.parse_speed) / len(self.parse_speed) if len(self.parse_speed) else 0
 
-        return stats
\ No newline at end of file
+        if self.profile:
+            stats.update(self.profile.get_stats())
+
+        return stats
+
+    def dump_profile(self):
+        self.last_dump = time.time()
+        try:
+            self.profile.dump()
+            msgr.send_msg('Filter profile saved to {}'.format(FilterProfile.DUMP_FNAME), logging.DEBUG)
+        except OSError as e:
+            msgr.send_msg('Failed saving filter profile: {}'.format(e), logging.WARN)
@@ -0,0 +1,121 @@
+import re
+import time
+
+# rate-limit rule values and states, e.g. '45:60:120,240:240:900' as hits:period:restriction
+_RULE_REGEX = re.compile('([0-9]+):([0-9]+):([0-9]+)')
+
+
+def parse_rules(value):
+    """ :return: list of (hits, period, restriction) of a rate-limit header value """
+    return [tuple(int(n) for n in match.groups()) for match in _RULE_REGEX.finditer(value)]
+
+
+class RequestPacer:
+    """
+    Spaces requests to the stash API.
+    The interval starts at the configured request delay. While page ID deltas show the scan is falling behind,
+    it is tightened down to the fastest rate the API's rate-limit headers allow, at the head of the stream it relaxes
+    back to the request delay. With smooth delay the interval moves there gradually, otherwise it jumps.
+    429 and 5xx responses hold off every request, for as long as the API asks or by an exponential backoff.
+    """
+
+    # behind when the average ID delta of recent pages is above this
+    BEHIND_DELTA = 100
+    TIGHTEN_STEP = 0.9
+    RELAX_STEP = 1.1
+    # API limits are only approached up to this margin
+    LIMIT_MARGIN = 1.1
+    MIN_BACKOFF = 2
+    MAX_BACKOFF = 60
+
+    def __init__(self, request_delay, smooth=True):
+        self.request_delay = request_delay
+        self.smooth = smooth
+
+        self.interval = request_delay
+        self.target = request_delay
+        self.limit_interval = None  # fastest interval the rate-limit rules allow, None until known
+
+        self.hold_until = 0
+        self.backoff = 0
+
+    @property
+    def floor(self):
+        """ Tightest interval, the request delay while API limits are unknown """
+        if self.limit_interval is None:
+            return self.request_delay
+        return self.limit_interval
+
+    def get_wait(self, last_request, now=None):
+        """ :return: seconds until the next request can be sent, 0 if it can be sent now """
+        now = time.time() if now is None else now
+        ready = self.hold_until
+        if last_request:
+            ready = max(ready, last_request + self.interval)
+        return max(ready - now, 0)
+
+    def update_deltas(self, deltas):
+        """ Adjusts the interval to the ID deltas of recently downloaded pages """
+        if not deltas:
+            return
+
+        behind = sum(deltas) / len(deltas) > self.BEHIND_DELTA
+        self.target = self.floor if behind else max(self.request_delay, self.floor)
+
+        if not self.smooth:
+            self.interval = self.target
+        elif self.interval > self.target:
+            self.interval = max(self.interval * self.TIGHTEN_STEP, self.target)
+        elif self.interval < self.target:
+            self.interval = min(self.interval * self.RELAX_STEP, self.target)
+
+    def on_response(self, code, headers, now=None):
+        """
+        Updates API limits and backoff from a response
+        :param headers: response headers by lowercase name
+        """
+        now = time.time() if now is None else now
+        self._read_limits(headers, now)
+
+        if code == 429 or code >= 500:
+            self.backoff = min(max(self.backoff * 2, self.MIN_BACKOFF), self.MAX_BACKOFF)
+            retry_after = headers.get('retry-after', '')
+            wait = int(retry_after) if retry_after.isdigit() else self.backoff
+            self.hold_until = max(self.hold_until, now + wait)
+            if code == 429:
+                # whatever the headers say, the current rate was too fast
+                self.interval = min(self.interval * 2, self.MAX_BACKOFF)
+            return wait
+
+        if code == 200:
+            self.backoff = 0
+        return 0
+
+    def _read_limits(self, headers, now):
+        limit_interval = None
+        for rule in headers.get('x-rate-limit-rules', '').split(','):
+            rule = rule.strip().lower()
+            if not rule:
+                continue
+
+            for hits, period, restriction in parse_rules(headers.get('x-rate-limit-{}'.format(rule), '')):
+                if hits:
+                    interval = period / hits * self.LIMIT_MARGIN
+                    limit_interval = interval if limit_interval is None else max(limit_interval, interval)
+
+            # an active restriction holds off requests until it ends
+            for hits, period, restriction in parse_rules(headers.get('x-rate-limit-{}-state'.format(rule), '')):
+                if restriction:
+                    self.hold_until = max(self.hold_until, now + restriction)
+
+        if limit_interval is not None:
+            self.limit_interval = limit_interval
+            self.interval = max(self.interval, limit_interval)
+
+    def get_stats(self):
+        stats = {}
+
+        stats['req-rate'] = 1 / self.interval if self.interval else None
+        stats['req-target-rate'] = 1 / self.target if self.target else None
+
+        return stats
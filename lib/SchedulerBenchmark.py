@@ -0,0 +1,105 @@
+"""
+Request scheduling benchmark of the downloader, no requests are sent.
+Usage: python -m lib.SchedulerBenchmark [<outstanding requests>]
+Outstanding requests are all queued at once in a random order, as during a retry storm,
+then dispatched one by one by minimal ID and completed in order, as during a catch-up burst.
+"""
+import random
+import sys
+import time
+
+from lib.Downloader import Downloader, Request, START_ID
+from lib.FlowControl import FlowControl
+
+
+class ListScheduler:
+    """ Scheduling over plain lists, as the downloader used to """
+
+    def __init__(self, conns):
+        self.requests = []
+        self.req_queue = []
+        self.free_handles = list(range(conns))
+
+    def add(self, req):
+        self.requests.append(req)
+
+    def submit(self, req):
+        self.req_queue.append(req)
+
+    def take(self):
+        req = sorted(self.req_queue, key=lambda r: self.requests.index(r))[0]
+        self.req_queue.remove(req)
+        return req, self.free_handles.pop(0)
+
+    def release(self, handle):
+        self.free_handles.append(handle)
+
+    def complete(self):
+        return self.requests.pop(0)
+
+
+class DownloaderScheduler:
+    """ Scheduling of an idle downloader """
+
+    def __init__(self, conns):
+        self.dl = Downloader(START_ID, conns=conns, flow=FlowControl(0))
+        self.dl.requests.clear()
+        self.dl.req_queue.clear()
+
+    def add(self, req):
+        req.seq = next(self.dl.req_seq)
+        self.dl.requests.append(req)
+
+    def submit(self, req):
+        self.dl._submit(req)
+
+    def take(self):
+        with self.dl.req_queue_lock:
+            return self.dl._take_request(), self.dl.free_handles.popleft()
+
+    def release(self, handle):
+        self.dl.free_handles.append(handle)
+
+    def complete(self):
+        return self.dl.requests.popleft()
+
+    def close(self):
+        self.dl._close()
+
+
+def benchmark(schedulers, n, conns=8, rounds=3):
+    reqs = [Request('{}-0-0-0-0'.format(i)) for i in range(n)]
+    submit_order = list(reqs)
+    random.shuffle(submit_order)
+
+    for name, scheduler_cls in schedulers:
+        best = None
+        for _ in range(rounds):
+            scheduler = scheduler_cls(conns)
+            for req in reqs:
+                scheduler.add(req)
+            for req in submit_order:
+                scheduler.submit(req)
+
+            start = time.perf_counter()
+            dispatched = []
+            for _ in range(n):
+                req, handle = scheduler.take()
+                dispatched.append(req)
+                scheduler.release(handle)
+            completed = [scheduler.complete() for _ in range(n)]
+            elapsed = time.perf_counter() - start
+
+            if hasattr(scheduler, 'close'):
+                scheduler.close()
+            best = elapsed if best is None else min(best, elapsed)
+
+        status = 'OK' if dispatched == reqs and completed == reqs else 'MISORDERED'
+        print('{:<12} {:>9.1f}ms {:>9.2f}us per dispatch  {}'.format(name, best * 1000, best / n * 1e6, status))
+
+
+if __name__ == '__main__':
+    outstanding = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    print('Outstanding requests: {}'.format(outstanding))
+    benchmark([('list', ListScheduler), ('downloader', DownloaderScheduler)], outstanding)
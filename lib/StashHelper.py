@@ -1,8 +1,12 @@
 import copy
-from itertools import chain
+import json
+import re
 
-from lib.CurrencyManager import cm
+from lib.CriteriaStats import crit_stats, get_sampler
+from lib.FilterProfiler import profile_index
+from lib.FilterSnapshot import load_snapshot
 from lib.ItemHelper import get_price, Item
+from lib.PageBuffer import read_stashes
 from lib.Utility import round_up
 import multiprocessing
 
@@ -43,6 +47,64 @@ if sys.platform.startswith('win'):
     forking.Popen = _Popen
 
 
+_NEXT_ID_REGEX = re.compile(rb'"next_change_id":\s*"([0-9\-]+)"')
+# start of the stashes array in a public stash API page
+_STASHES_REGEX = re.compile(rb'"stashes"\s*:\s*\[')
+# skips over anything (including strings) up to the next curly brace
+_BRACE_REGEX = re.compile(rb'[^"{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}]*)*([{}])')
+_OPEN_BRACE = ord('{')
+# league names encoded the same by any JSON encoder, these can be looked for in raw stash objects
+_PLAIN_LEAGUE_REGEX = re.compile(r'[A-Za-z0-9 ()_\-]+$')
+
+
+class StashSplitter:
+    """ Locates complete stash objects in a public stash API page while it is still being received """
+
+    def __init__(self):
+        self.ranges = []  # (start, end) byte offsets of every complete stash
+        self.done = False
+
+        self._pos = None
+        self._depth = 0
+        self._start = None
+
+    def feed(self, data):
+        """
+        :param data: page contents received so far, must start with the same bytes as the previous call
+        :return: number of stashes completed by this call
+        """
+        if self._pos is None:
+            match = _STASHES_REGEX.search(data)
+            if match is None:
+                return 0
+            self._pos = match.end()
+
+        found = len(self.ranges)
+        pos, depth = self._pos, self._depth
+        match = _BRACE_REGEX.match
+
+        while not self.done:
+            m = match(data, pos)
+            if m is None:
+                break
+
+            pos = m.end()
+            if data[pos - 1] == _OPEN_BRACE:
+                if depth == 0:
+                    self._start = pos - 1
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self.ranges.append((self._start, pos))
+                elif depth < 0:
+                    # end of the page object
+                    self.done = True
+
+        self._pos, self._depth = pos, depth
+        return len(self.ranges) - found
+
+
 class StashTab:
     def __init__(self, stash):
         self.name = stash['stash']
@@ -70,102 +132,156 @@ def get_stash_price_raw(stash):
     return None
 
 
-def parse_next_id(data, stateMgr):
-    stateMgr.saveState(data["next_change_id"])
+def peek_next_id(data):
+    m = _NEXT_ID_REGEX.search(data)
+    if m:
+        return m.group(1).decode()
+    return None
 
 
-def parse_stashes_parallel(data, filters, ccm, league, c_budget, stateMgr, resultHandler, numCores, pool):
-    item_count = 0
-    league_stashes = []
-    for stash in data["stashes"]:
-        if stash["public"] and stash["items"] and stash["items"][0]["league"] == league:
-            item_count += len(stash["items"])
-            league_stashes.append(stash)
+def parse_next_id(data, stateMgr):
+    next_id = peek_next_id(data)
+    if next_id is None:
+        raise ValueError('Page is missing next_change_id')
+    stateMgr.saveState(next_id)
+
+
+def split_stashes(data, parts):
+    """ Splits raw page data to contiguous groups of stash object ranges of about the same size """
+    splitter = StashSplitter()
+    splitter.feed(data)
+
+    groups = []
+    if splitter.ranges:
+        group_size = (splitter.ranges[-1][1] - splitter.ranges[0][0]) / parts
+        group_end = splitter.ranges[0][0] + group_size
+        group = []
+        for begin, end in splitter.ranges:
+            group.append((begin, end))
+            if end >= group_end:
+                groups.append(group)
+                group = []
+                group_end += group_size
+        if group:
+            groups.append(group)
+
+    return groups, len(splitter.ranges)
+
+
+def handle_results(results, chunks, filters, stateMgr, resultHandler):
+    """
+    Handles match records of a worker task. Only stashes of new items are decoded again.
+    :param chunks: raw stash objects the task was given
+    :param filters: filters of the snapshot the task was given, the result handler gets copies of them
+    """
+    stashes = {}
+    for stash_idx, item_idx, filter_idx, item_id, price_raw, account in results:
+        if stateMgr.addItem(item_id, price_raw, account):
+            stash = stashes.get(stash_idx)
+            if stash is None:
+                stash = stashes[stash_idx] = json.loads(str(chunks[stash_idx], 'utf-8'))
+            # a copy, snapshot filters change when filters are compiled again
+            resultHandler(Item(stash["items"][item_idx], get_stash_price(stash)), stash, copy.deepcopy(filters[filter_idx]))
+
+
+def handle_stats(stats, filters, profile):
+    """
+    Handles statistics reported by a worker task
+    :param filters: filters of the snapshot the task was given
+    :param profile: FilterProfile, None when not profiling filters
+    """
+    crit_stats.add(filters, stats['criteria'])
+    if profile is not None:
+        profile.add(filters, stats['filters'])
+
+
+def parse_stashes_parallel(data, snapshot, league, stateMgr, resultHandler, numCores, pool, page, profile=None,
+                           sample_interval=0):
+    # stashes are passed to the workers through the page buffer, decoding them is left to the workers
+    groups, stash_count = split_stashes(data, numCores)
+    sources = page.store(data, groups)
+
+    results = pool.starmap(parse_stash_data,
+                           ((source, league, snapshot.ref, profile is not None, sample_interval)
+                            for source in sources), 1)
+
+    view = memoryview(data)
+    league_tabs, item_count = 0, 0
+    for group, (group_results, n_tabs, n_league_tabs, n_items, stats) in zip(groups, results):
+        if group_results:
+            chunks = [view[begin:end] for begin, end in group]
+            handle_results(group_results, chunks, snapshot.filters, stateMgr, resultHandler)
+        handle_stats(stats, snapshot.filters, profile)
+        league_tabs += n_league_tabs
+        item_count += n_items
 
-    # results = Parallel(n_jobs=numCores, verbose=10)(delayed(parse_stash)(stash, filters, c_budget) for stash in league_stashes)
-    # results = pool(delayed(parse_stash)(stash, filters, c_budget) for stash in league_stashes)
-    # pool = None
-    # if pool:
-    #TODO: send multiple stashes to reduce overhead
-    # results = pool.starmap(parse_stash, ((stash, filters, c_budget, ccm) for stash in league_stashes), round_up(len(league_stashes)/numCores))
+    parse_next_id(data, stateMgr)
+    return stash_count, league_tabs, item_count
 
-    grouped_stashes = []
-    step, extra = divmod(len(league_stashes), numCores)
-    for i in range(0, numCores):
-        if i == 0:
-            grouped_stashes.append(league_stashes[:step + extra])
-        else:
-            sx = i * step + extra
-            grouped_stashes.append(league_stashes[sx:sx + step])
 
-    results = pool.starmap(parse_stashes, ((stashes, filters, c_budget, ccm) for stashes in grouped_stashes), 1)
+def get_league_probe(league):
+    """ :return: JSON string of a league, every raw stash object in the league contains it. None if unknown """
+    if _PLAIN_LEAGUE_REGEX.match(league):
+        return '"{}"'.format(league)
+    return None
 
-    # else:
-    #     results = (parse_stash(stash, filters, c_budget) for stash in league_stashes)
+def parse_stash_data(source, league, snapshot, profile=False, sample_interval=0):
+    """
+    Decodes and parses raw stash objects, as located by StashSplitter
+    :param profile: if set, filter statistics are recorded and returned along with the results
+    :param sample_interval: if set, filter criteria are sampled on one of every sample_interval items
+    :return: match records, stash count, league stash count, item count, statistics
+    """
+    index, c_budget = load_snapshot(snapshot)
+    profiler = profile_index(index) if profile else None
+
+    chunks = read_stashes(source)
+    probe = get_league_probe(league)
+    items = []
+    league_tabs = 0
+    item_count = 0
+    for stash_idx, chunk in enumerate(chunks):
+        # stashes of other leagues are skipped without decoding them
+        if probe is not None and probe not in chunk:
+            continue
 
-    for item, stash, fltr in chain.from_iterable(results):
-        if stateMgr.addItem(item.id, item.get_price_raw(get_stash_price_raw(stash)), stash["accountName"]):
-            resultHandler(copy.deepcopy(item), copy.copy(stash), copy.deepcopy(fltr))
+        stash = json.loads(chunk)
+        if stash["public"] and stash["items"] and stash["items"][0]["league"] == league:
+            league_tabs += 1
+            item_count += len(stash["items"])
+            _add_stash_items(stash, stash_idx, c_budget, items)
 
-    parse_next_id(data, stateMgr)
-    return len(data["stashes"]), len(league_stashes), item_count
+    # items of all stashes are matched together, allowing the index to match them in batches
+    matches = index.match_all([entry[2] for entry in items])
+    results = []
+    for (stash_idx, item_idx, item, price_raw, account), match in zip(items, matches):
+        if match:
+            results.append((stash_idx, item_idx, match[0], item.id, item.get_price_raw(price_raw), account))
 
+    stats = {'criteria': {}}
+    if sample_interval:
+        sampler = get_sampler(sample_interval)
+        sampler.sample(index, [entry[2] for entry in items])
+        stats['criteria'] = sampler.collect()
 
-def parse_stash(stash, filters, c_budget, ccm):
-    cm.fromCCM(ccm)
+    if profiler:
+        stats['filters'] = profiler.collect()
 
-    results = []
+    return results, len(chunks), league_tabs, item_count, stats
+
+def _add_stash_items(stash, stash_idx, c_budget, items):
+    """ Adds stash index, item index, item, stash raw price and account of every item within budget """
     stash_price = get_stash_price(stash)
-    for item in stash["items"]:
+    stash_price_raw = get_stash_price_raw(stash)
+    for item_idx, item in enumerate(stash["items"]):
         curItem = Item(item, stash_price)
 
         if within_budget(curItem, c_budget):
-            for fltr in filters:
-                if fltr.checkItem(curItem):
-                    results.append((curItem, stash, fltr))
-                    break
-
-    return results
-
-def parse_stashes(stashes, filters, c_budget, ccm):
-    cm.fromCCM(ccm)
-
-    results = []
-    for stash in stashes:
-        stash_price = get_stash_price(stash)
-        stash_id = stash['id']
-        for item in stash["items"]:
-            curItem = Item(item, stash_price)
-
-            if within_budget(curItem, c_budget):
-                for fltr in filters:
-                    if fltr.checkItem(curItem):
-                        results.append((curItem, stash, fltr))
-                        break
-
-    return results
+            items.append((stash_idx, item_idx, curItem, stash_price_raw, stash["accountName"]))
 
 def within_budget(item, c_budget):
     return not (item.c_price is not None and c_budget is not None and item.c_price > c_budget)
 
-# def parse_stashes(data, filters, league, stateMgr, resultHandler):
-#     league_tabs = 0
-#     item_count = 0
-#
-#     for stash in data["stashes"]:
-#         if stash["public"] and stash["items"] and stash["items"][0]["league"] == league:
-#             league_tabs += 1
-#             item_count += len(stash["items"])
-#             for item in stash["items"]:
-#                 curItem = Item(item, stash)
-#                 for fltr in filters:
-#                     if fltr.checkItem(curItem):
-#                         if stateMgr.addItem(curItem.id, get_item_price_raw(item, stash), stash["accountName"]):
-#                             resultHandler(curItem, stash, fltr)
-#                         break
-#
-#     parse_next_id(data, stateMgr)
-#     return len(data["stashes"]), league_tabs, item_count
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()
\ No newline at end of file
@@ -9,16 +9,17 @@ import pycurl
 # from multiprocessing.pool import Pool
 
 from datetime import datetime
-from queue import Empty, Full
 from threading import Event
 from urllib.parse import urljoin
 
 
+from lib.AsyncDownloader import AsyncDownloader
 from lib.Downloader import Downloader, get_delta
 from lib.UpdateThread import UpdateThread
 from lib.CompiledFilter import CompiledFilter
 from lib.CurrencyManager import cm
 from lib.FilterManager import fm
+from lib.FlowControl import FlowControl
 from lib.ItemHelper import *
 from lib.ItemHelper import Item, ItemType, ItemSocket, ItemProperty
 from lib.NotifyThread import NotifyThread
@@ -41,6 +42,9 @@ POE_BETA_API = "http://betaapi.pathofexile.com/api/public-stash-tabs?id={}"
 JSON_ERROR_FNAME = "log\\error.json"
 ITEM_ERROR_FNAME = 'log\\item_error.json'
 
+# downloader backends by setting value
+DOWNLOADERS = {'pycurl': Downloader, 'asyncio': AsyncDownloader}
+
 
 class StashScanner:
     def __init__(self):
@@ -50,6 +54,7 @@ class StashScanner:
         self.updater = UpdateThread(fm, 10 * 60)
         self.parser = None
         self.downloader = None
+        self.flow = None
         self._stop = Event()
 
         self.poe_api_url = None
@@ -175,7 +180,8 @@ class StashScanner:
         self.updater.start()
         self.notifier.start()
 
-        get_next = True
+        # downloader hands requests directly to the parser, within the memory budget
+        self.flow = FlowControl(config.memory_budget * 1024 ** 2)
 
         msgr.send_msg("Scanning started")
         msgr.send_update_id(self.stateMgr.getChangeId())
@@ -183,7 +189,11 @@ class StashScanner:
             if self.downloader is None or not self.downloader.is_alive():
                 if self.downloader:
                     msgr.send_msg("Download thread ended abruptly. Restarting it..", logging.WARN)
-                self.downloader = Downloader(self.stateMgr.getChangeId(), conns=config.max_conns)
+                    # downloading restarts from the last saved ID, pending requests would be parsed twice
+                    self.flow.clear()
+                downloader_cls = DOWNLOADERS.get(str(config.downloader).lower(), Downloader)
+                self.downloader = downloader_cls(self.stateMgr.getChangeId(), conns=config.max_conns,
+                                                 stream=config.stream_parsing, flow=self.flow)
                 self.downloader.start()
 
             if self.parser is None or not self.parser.is_alive() and not self.parser.signal_stop:
@@ -194,20 +204,13 @@ class StashScanner:
                 else:
                     workers = max((os.cpu_count() or 1) - 1, 1)
 
-                self.parser = ParserThread(workers, self.league, self.stateMgr, self.handleResult)
+                self.parser = ParserThread(workers, self.league, self.stateMgr, self.handleResult, self.flow,
+                                           profile_filters=config.profile_filters,
+                                           sample_interval=config.criteria_sampling)
                 self.parser.start()
 
-            try:
-                if get_next:
-                    req_id, resp = self.downloader.get(timeout=0.5)
-                    get_next = False
-
-                self.parser.put(req_id, resp, timeout=0.5)
-                get_next = True
-            except Full:
-                msgr.send_msg("Parser queue is full.. waiting for parser..", logging.WARN)
-            except Empty:
-                continue
+            # only watches over the threads, requests are handed over without going through here
+            self._stop.wait(0.5)
 
     def _get_latest_id(self, is_beta):
         latest_id = None
@@ -242,6 +245,7 @@ class StashScanner:
     def getStatistics(self):
         dler = self.downloader
         parser = self.parser
+        flow = self.flow
 
         stats = {}
 
@@ -249,6 +253,8 @@ class StashScanner:
             stats.update(dler.get_stats())
         if parser:
             stats.update(parser.get_stats())
+        if flow:
+            stats.update(flow.get_stats())
 
         return stats
 
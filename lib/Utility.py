@@ -94,10 +94,15 @@ class AppConfiguration:
 
         self.request_delay = None
         self.smooth_delay = None
+        self.stream_parsing = None
+        self.profile_filters = None
+        self.criteria_sampling = None
+        self.downloader = None
         self.scan_mode = None
         self.history_retention = None
         self.num_workers = None
         self.max_conns = None
+        self.memory_budget = None
 
         self.notify = None
         self.notify_copy_msg = None
@@ -194,14 +199,35 @@ class AppConfiguration:
         except Exception:
             self.num_workers = 0
 
+        try:
+            self.memory_budget = int(settings['memory_budget'])
+        except Exception:
+            self.memory_budget = 256
+
         try:
             self.smooth_delay = str2bool(settings['smooth_delay'])
         except Exception:
             self.smooth_delay = True
 
+        try:
+            self.stream_parsing = str2bool(settings['stream_parsing'])
+        except Exception:
+            self.stream_parsing = False
+
+        try:
+            self.profile_filters = str2bool(settings['profile_filters'])
+        except Exception:
+            self.profile_filters = False
+
+        try:
+            self.criteria_sampling = int(settings['criteria_sampling'])
+        except Exception:
+            self.criteria_sampling = 0
+
         # TODO: validate
         self.league = settings.get('league', 'Standard')
         self.scan_mode = settings.get('scan_mode', 'Latest')
+        self.downloader = settings.get('downloader', 'pycurl')
 
     def update(self, cfg):
         if not isinstance(cfg, AppConfiguration):
@@ -212,9 +238,14 @@ class AppConfiguration:
         self.scan_mode = cfg.scan_mode
         self.request_delay = cfg.request_delay
         self.smooth_delay = cfg.smooth_delay
+        self.stream_parsing = cfg.stream_parsing
+        self.profile_filters = cfg.profile_filters
+        self.criteria_sampling = cfg.criteria_sampling
+        self.downloader = cfg.downloader
         self.history_retention = cfg.history_retention
         self.num_workers = cfg.num_workers
         self.max_conns = cfg.max_conns
+        self.memory_budget = cfg.memory_budget
 
         self.notify = cfg.notify
         self.notify_copy_msg = cfg.notify_copy_msg
@@ -230,10 +261,15 @@ class AppConfiguration:
 
             'request_delay': self.request_delay,
             'smooth_delay': self.smooth_delay,
+            'stream_parsing': self.stream_parsing,
+            'profile_filters': self.profile_filters,
+            'criteria_sampling': self.criteria_sampling,
+            'downloader': self.downloader,
             'scan_mode': self.scan_mode,
             'history_retention': self.history_retention,
             'num_workers': self.num_workers,
             'maximum_connections': self.max_conns,
+            'memory_budget': self.memory_budget,
 
             'notify': self.notify,
             'notify_copy_msg': self.notify_copy_msg,
@@ -211,7 +211,12 @@ class SettingsEditor(Frame):
         cfg.history_retention = int(self.entry_history_retention.get() or 1)
         cfg.max_conns = int(self.entry_max_conns.get() or 8)
         cfg.num_workers = int(self.entry_num_workers.get() or 0)
+        cfg.memory_budget = config.memory_budget
         cfg.smooth_delay = config.smooth_delay
+        cfg.stream_parsing = config.stream_parsing
+        cfg.profile_filters = config.profile_filters
+        cfg.criteria_sampling = config.criteria_sampling
+        cfg.downloader = config.downloader
 
         self.app.update_configuration(cfg)
 